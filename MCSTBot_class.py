@@ -1,236 +1,904 @@
 from utils import *
+from batch_rollouts import batch_rollouts
+from game_state import LineIndex, GameState
+from search_stats import SearchStats
 import os
 import numpy as np
 import math
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import config
 
-class MCTSNode:
-    def __init__(self, state, valid_moves, player, parent=None):
+
+def compute_ucb(V, N, parent_N):
+    """
+    UCB1 scores of a set of children given their total values V and visit counts N.
+    Children never visited get an infinite score.
+    """
+    ucb = np.full(len(N), math.inf)
+    visited = N > 0
+    if parent_N > 0:
+        ucb[visited] = V[visited]/N[visited] + 2* np.sqrt((2 * math.log(parent_N)) /N[visited])
+    return ucb
+
+def compute_rave_ucb(V, N, amaf_V, amaf_N, parent_N, k, exploration=2):
+    """
+    RAVE scores: the value of each child is blended with its all-moves-as-first value, whose weight
+    beta = sqrt(k / (3 N + k)) fades as the child gets visits, plus the exploration term of compute_ucb
+    scaled by exploration. Children with neither visits nor AMAF samples get an infinite score.
+    """
+    visits = np.maximum(N, 1)
+    value = V / visits
+    # beta is 1 for a child never visited, its score is then its AMAF value alone
+    beta = np.sqrt(k / (3 * N + k))
+    scores = value + beta * (np.where(amaf_N > 0, amaf_V / np.maximum(amaf_N, 1), value) - value)
+    if parent_N > 0 and exploration:
+        scores += exploration * np.sqrt((2 * math.log(parent_N)) / visits)
+    scores[(N == 0) & (amaf_N == 0)] = math.inf
+    return scores
+
+
+class MCTSTree:
+    def __init__(self, capacity=1024, n_cells=9):
+        """
+        Search graph stored as flat arrays. Positions reached through different move orders share one node,
+        found through a transposition table, so the graph is a DAG and the statistics used by the
+        selection are kept on the edges.
+        Node i is described by the i-th item of the node arrays:
+        - first_edge, n_slots: the outgoing edges of a node are stored contiguously, n_slots edges being
+          reserved when the node is first expanded (0 while it has not been).
+        - n_edges: the edges created so far, the first n_edges of the slots. Edges are created one at a time
+          (lazy expansion), untried being the bitmask of the moves that have no edge yet.
+        - N: number of simulations that went through the node.
+        - state0, state1: bitboards of the two players.
+        - player: player that has to move next.
+        - proven: value of the node for the player to move (1 win, 0 draw, -1 loss) once it has been proven
+          by the MCTS-Solver, UNKNOWN before.
+        - proven_child: some child of the node has been proven, only then does the selection look for children to skip.
+        Edge e is described by the e-th item of the edge arrays:
+        - child: node the edge leads to.
+        - move: the move played along the edge.
+        - edge_N, edge_V: number of visits and total value of the move from this parent.
+        - amaf_N, amaf_V: all-moves-as-first statistics of the move, used by RAVE: simulations through the parent
+          where the player to move played this move at any later point, and their total value.
+        Bitboards of more than 62 cells do not fit in int64 and are stored as Python ints.
+        """
+        self.n_nodes = 0
+        self.first_edge = np.zeros(capacity, dtype=np.int32)
+        self.n_slots = np.zeros(capacity, dtype=np.int32)
+        self.n_edges = np.zeros(capacity, dtype=np.int32)
+        self.N = np.zeros(capacity, dtype=np.int64)
+        state_dtype = np.int64 if n_cells <= 62 else object
+        self.state0 = np.zeros(capacity, dtype=state_dtype)
+        self.state1 = np.zeros(capacity, dtype=state_dtype)
+        self.untried = np.zeros(capacity, dtype=state_dtype)
+        self.player = np.zeros(capacity, dtype=np.int8)
+        self.proven = np.full(capacity, self.UNKNOWN, dtype=np.int8)
+        self.proven_child = np.zeros(capacity, dtype=bool)
+
+        self.n_edges_used = 0
+        self.child = np.full(capacity, -1, dtype=np.int32)
+        self.move = np.full(capacity, -1, dtype=np.int16)
+        self.edge_N = np.zeros(capacity, dtype=np.int64)
+        self.edge_V = np.zeros(capacity, dtype=np.float64)
+        self.amaf_N = np.zeros(capacity, dtype=np.int64)
+        self.amaf_V = np.zeros(capacity, dtype=np.float64)
+
+        self.table = {} # (state0, state1) -> node
+        self.n_transpositions = 0 # edges linked to a node that already existed
+
+    UNKNOWN = 2 # proven value of the nodes that are not proven
+
+    NODE_ARRAYS = ['first_edge', 'n_slots', 'n_edges', 'N', 'state0', 'state1', 'untried', 'player', 'proven', 'proven_child']
+    EDGE_ARRAYS = ['child', 'move', 'edge_N', 'edge_V', 'amaf_N', 'amaf_V']
+
+    def __len__(self):
+        return self.n_nodes
+
+    def _grow(self, names, min_capacity):
+        capacity = max(len(getattr(self, names[0])), 1)
+        while capacity < min_capacity:
+            capacity *= 2
+        for name in names:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _add_node(self, state, player):
+        node = self.n_nodes
+        if node >= len(self.N):
+            self._grow(self.NODE_ARRAYS, node + 1)
+        self.n_slots[node] = 0
+        self.n_edges[node] = 0
+        self.N[node] = 0
+        self.state0[node], self.state1[node] = state
+        self.untried[node] = 0
+        self.player[node] = player
+        self.proven[node] = self.UNKNOWN
+        self.proven_child[node] = False
+        self.table[state] = node
+        self.n_nodes += 1
+        return node
+
+    def add_root(self, state, player):
+        self.n_nodes = 0
+        self.n_edges_used = 0
+        self.table = {}
+        self.n_transpositions = 0
+        return self._add_node((int(state[0]), int(state[1])), player)
+
+    def reserve(self, node, moves):
+        """Reserves the edge slots of node, one for each move of the bitmask moves, without creating any edge yet."""
+
+        start, end = self.n_edges_used, self.n_edges_used + popcount(moves)
+        if end > len(self.child):
+            self._grow(self.EDGE_ARRAYS, end)
+        self.child[start:end] = -1
+        self.edge_N[start:end] = 0
+        self.edge_V[start:end] = 0
+        self.amaf_N[start:end] = 0
+        self.amaf_V[start:end] = 0
+
+        self.first_edge[node] = start
+        self.n_slots[node] = end - start
+        self.n_edges[node] = 0
+        self.untried[node] = moves
+        self.n_edges_used = end
+        return start
+
+    def add_child(self, node, move):
         """
-        Each node represents a state in the game.
-        - state: instance of TicTacToeState.
-        - parent: parent node (None for root).
-        - move: the move that led to this state.
+        Creates the edge of an untried move of node, linked to the node of the resulting state,
+        which is created only if no other path reached it already. Returns the index of the edge.
         """
-        self.state = state
-        self.valid_moves = valid_moves
-        self.player = player # player that have to move next
 
-        self.parent = parent
-        self.children = []
+        state0, state1 = int(self.state0[node]), int(self.state1[node])
+        player = int(self.player[node])
+        state = (state0 | (1 << move), state1) if player == 0 else (state0, state1 | (1 << move))
+        child = self.table.get(state)
+        if child is None:
+            child = self._add_node(state, 1 - player)
+        else:
+            self.n_transpositions += 1
 
-        self.N = 0
-        self.V = 0
-        self.ucb = math.inf
+        edge = int(self.first_edge[node] + self.n_edges[node])
+        self.child[edge] = child
+        self.move[edge] = move
+        self.n_edges[node] += 1
+        self.untried[node] = int(self.untried[node]) & ~(1 << move)
+        return edge
 
-    def update_board(self, move):
-        """Update the board with the given move."""
+    def add_children(self, node, moves):
+        """
+        Creates at once the edges of node for all the moves, linked to the nodes of the resulting states,
+        which are created only if no other path reached them already. Returns the index of the first edge.
+        """
 
-        if (self.state[0] | self.state[1]) & (1 << move) != 0:
-            #raise ValueError('Invalid move')
-            print('Invalid move')
-            return
+        start, end = self.n_edges_used, self.n_edges_used + len(moves)
+        if end > len(self.child):
+            self._grow(self.EDGE_ARRAYS, end)
 
-        new_moves = self.valid_moves.copy()
-        new_moves.remove(move)
-        if self.player == 0:
-            return (self.state[0] | (1 << move), self.state[1]), new_moves
+        state0, state1 = int(self.state0[node]), int(self.state1[node])
+        player = int(self.player[node])
+        if player == 0:
+            states = [(state0 | (1 << move), state1) for move in moves]
         else:
-            return (self.state[0], self.state[1] | (1 << move)), new_moves
-        
+            states = [(state0, state1 | (1 << move)) for move in moves]
+        children = [self.table.get(state) for state in states]
+
+        # nodes of the states not reached before are created in one block
+        new_states = [state for state, child in zip(states, children) if child is None]
+        first_new, end_new = self.n_nodes, self.n_nodes + len(new_states)
+        if end_new > len(self.N):
+            self._grow(self.NODE_ARRAYS, end_new)
+        if new_states:
+            self.n_slots[first_new:end_new] = 0
+            self.n_edges[first_new:end_new] = 0
+            self.N[first_new:end_new] = 0
+            self.state0[first_new:end_new] = [state[0] for state in new_states]
+            self.state1[first_new:end_new] = [state[1] for state in new_states]
+            self.untried[first_new:end_new] = 0
+            self.player[first_new:end_new] = 1 - player
+            self.proven[first_new:end_new] = self.UNKNOWN
+            self.proven_child[first_new:end_new] = False
+        new_node = first_new
+        for i, child in enumerate(children):
+            if child is None:
+                self.table[states[i]] = children[i] = new_node
+                new_node += 1
+        self.n_nodes = end_new
+        self.n_transpositions += len(moves) - len(new_states)
+
+        self.child[start:end] = children
+        self.move[start:end] = moves
+        self.edge_N[start:end] = 0
+        self.edge_V[start:end] = 0
+        self.amaf_N[start:end] = 0
+        self.amaf_V[start:end] = 0
+
+        self.first_edge[node] = start
+        self.n_slots[node] = self.n_edges[node] = len(moves)
+        self.untried[node] = 0
+        self.n_edges_used = end
+        return start
+
+    def find(self, state):
+        """Returns the index of the node holding the given state, or None."""
+        return self.table.get((int(state[0]), int(state[1])))
+
+    def reroot(self, node):
+        """
+        Keeps only the part of the graph reachable from node, moving it to the front of the arrays
+        with node as root (index 0). Nodes are copied in breadth first order, each one once even when
+        several edges lead to it, and the slot blocks are copied in the same order so that they stay contiguous.
+        """
+
+        order = [node]
+        new_index = {node: 0}
+        i = 0
+        while i < len(order):
+            first = int(self.first_edge[order[i]])
+            for child in self.child[first:first + int(self.n_edges[order[i]])]:
+                child = int(child)
+                if child not in new_index:
+                    new_index[child] = len(order)
+                    order.append(child)
+            i += 1
+
+        order = np.array(order)
+        n_slots = self.n_slots[order]
+        # slot e of the i-th node in order goes to position new_first_edge[i] + e
+        new_first_edge = np.concatenate([[0], np.cumsum(n_slots)[:-1]]).astype(np.int32)
+        old_edges = np.repeat(self.first_edge[order] - new_first_edge, n_slots) + np.arange(int(n_slots.sum()))
+
+        for name in ['N', 'state0', 'state1', 'untried', 'player', 'proven', 'proven_child', 'n_slots', 'n_edges']:
+            array = getattr(self, name)
+            array[:len(order)] = array[order]
+        self.first_edge[:len(order)] = new_first_edge
+        self.n_nodes = len(order)
+
+        remap = np.full(len(self.N), -1, dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
+        for name in ['move', 'edge_N', 'edge_V', 'amaf_N', 'amaf_V']:
+            array = getattr(self, name)
+            array[:len(old_edges)] = array[old_edges]
+        old_child = self.child[old_edges]
+        self.child[:len(old_edges)] = np.where(old_child >= 0, remap[old_child], -1)
+        self.n_edges_used = len(old_edges)
+
+        self.table = {self.state(i): i for i in range(self.n_nodes)}
+        return 0
+
+    def clear(self):
+        self.n_nodes = 0
+        self.n_edges_used = 0
+        self.table = {}
+
+    def edges(self, node):
+        start = int(self.first_edge[node])
+        return slice(start, start + int(self.n_edges[node]))
+
+    def state(self, node):
+        return (int(self.state0[node]), int(self.state1[node]))
+
+    def valid_moves(self, node, size):
+        return empty_cells(self.state(node), size)
     
 
 class MCTSBot:
 
-    def __init__(self, size, winning_configurations, player, verbose=0):
+    def __init__(self, size, winning_configurations, player, verbose=0, reuse_tree=True, rollouts_per_leaf=config.N_ROLLOUTS_PER_LEAF,
+                 n_workers=config.N_MCTS_WORKERS, seed=None, time_budget_ms=None, node_budget=None, collect_stats=False, stats_sink=None, book=None,
+                 widening_c=config.MCTS_WIDENING_C, widening_alpha=config.MCTS_WIDENING_ALPHA, rave_k=config.MCTS_RAVE_K,
+                 rave_exploration=config.MCTS_RAVE_EXPLORATION, solver=config.MCTS_SOLVER):
+        """
+        - reuse_tree: if True, the subtree of the position reached after our move and the opponent's reply
+          is kept for the next search, otherwise every move is searched with a fresh tree.
+        - rollouts_per_leaf: number of games simulated from each selected leaf. With more than one,
+          the games are played together by batch_rollouts and backpropagated as a single update.
+        - n_workers: with more than one worker, each move is searched by n_workers independent searches run
+          in a process pool from the same root (root parallelisation), and the statistics of the root children
+          are summed before picking the move. The tree is not reused across moves in this mode.
+        - seed: seed of the random generators, used to reproduce the searches.
+        - time_budget_ms, node_budget: default budgets of next_move, see there.
+        - collect_stats: if True, every search fills a SearchStats object, available as self.last_stats.
+        - stats_sink: function called with the SearchStats of every search (implies collect_stats).
+        - book: OpeningBook consulted before searching, its hits and misses count the book moves played.
+        - widening_c, widening_alpha: progressive widening, a node visited N times gets a new child only while it has
+          less than max(1, widening_c * N ** widening_alpha) of them. With widening_c = None a node gets a new child
+          at every visit until all its moves have been tried.
+        - rave_k: enables RAVE. Every move played by a player later in a simulation is credited to the sibling edge
+          of that move (all moves as first), and the selection blends the AMAF value of an edge with its own value,
+          the AMAF weight being sqrt(rave_k / (3 N + rave_k)) for an edge visited N times. Nodes are then expanded
+          with all their children at once so that each of them gathers AMAF statistics, which makes progressive
+          widening moot. Needs single rollouts and boards of at most 62 cells.
+        - rave_exploration: weight of the UCB exploration term in RAVE mode (it is 2 without RAVE), the AMAF values
+          already spread the visits so less exploration is needed.
+        - solver: MCTS-Solver. Terminal positions and positions with a winning move are marked as proven, and
+          the proofs are propagated minimax style: a node is won as soon as one child is lost for the opponent, and
+          lost or drawn once all its children are proven. Simulations reaching a proven node use its value instead of
+          a rollout, children proven lost are not selected, and the search stops once the root is proven.
+        """
         self.name = 'MCTSBot'
         self.winning_configurations = winning_configurations
+        self.line_index = LineIndex(size, winning_configurations)
         self.size = size
         self.player = player
 
-        self.root = None # starting configuration on which we start building the tree
+        self.tree = MCTSTree(n_cells=size * size)
+        self.root = 0 # starting configuration on which we start building the tree
+        self.reuse_tree = reuse_tree
+        self.reused_visits = 0 # visits inherited from the previous search by the current root
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.n_workers = n_workers
+        self._executor = None
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+
+        self.time_budget_ms = time_budget_ms
+        self.node_budget = node_budget
+        self.iterations_done = 0 # iterations and time used by the last search
+        self.search_time_ms = 0
+
+        self.book = book
+        self.widening_c = widening_c
+        self.widening_alpha = widening_alpha
+        self.rave_k = rave_k
+        self.rave_exploration = rave_exploration
+        self.solver = solver
+        if rave_k is not None and (rollouts_per_leaf > 1 or size * size > 62):
+            raise ValueError('RAVE needs rollouts_per_leaf = 1 and boards of at most 62 cells')
+
+        self.collect_stats = collect_stats or stats_sink is not None
+        self.stats_sink = stats_sink
+        self.last_stats = None
+        self.selection_depth = 0 # depth of the last selected leaf
+        self.rollout_plies = 0   # plies and forced moves of the last rollouts
+        self.rollout_forced = 0
+        self.rollout_max_plies = 0 # length of the longest of the last rollouts
+        self.rollout_moves = (0, 0) # bitmasks of the moves of each player in the last rollout
         
         self.verbose = verbose
 
     def __str__(self):
         return self.name
+
+    def __getstate__(self):
+        # the process pool cannot be sent to other processes
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
+
+    def reset(self):
+        """Forgets the search tree, e.g. before starting a new game."""
+        self.tree.clear()
+        self.root = 0
+        self.reused_visits = 0
+
+    def close(self):
+        """Shuts down the process pool used by root parallel searches."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
     
     
-    def next_move(self, current_state, valid_moves):
+    def next_move(self, current_state, valid_moves, time_budget_ms=None, node_budget=None):
+        """
+        Searches the current state and returns the move with the highest average value.
+        valid_moves is a bitmask of moves or a list of them.
+        - time_budget_ms: the search stops once this many milliseconds have passed.
+        - node_budget: the search stops after this many iterations (selected and simulated leaves).
+        When both are given the search stops at the first one that runs out, when neither is given
+        (here or in the constructor) (number of valid moves) * config.N_ITERATIONS_PER_MOVE iterations are run.
+        """
         
-        self.root = MCTSNode(current_state, valid_moves, self.player)
-
-        if is_move_forced(self.root.state, self.winning_configurations, self.size) is not None:
+        state = tuple(current_state)
+        valid_moves = as_move_mask(valid_moves)
+        time_budget_ms = self.time_budget_ms if time_budget_ms is None else time_budget_ms
+        node_budget = self.node_budget if node_budget is None else node_budget
+
+        self.last_stats = SearchStats() if self.collect_stats else None
+        # forced, book and root-parallel moves reuse no tree
+        self.iterations_done = 0
+        self.search_time_ms = 0
+        self.reused_visits = 0
+
+        root_state = GameState(self.line_index, state)
+        # a winning move comes before blocking the opponent
+        forced_move = root_state.winning_move(self.player)
+        if forced_move is None:
+            forced_move = root_state.forced_move()
+        if forced_move is not None:
             if self.verbose >= 1:
                 print('THE NEXT MOVE IS FORCED')
-            return is_move_forced(self.root.state, self.winning_configurations, self.size)
+            if self.last_stats is not None:
+                self.last_stats.root_forced = True
+                self._send_stats()
+            return forced_move
 
-        for move in self.root.valid_moves:
-            
-            new_state, new_valid_moves = self.root.update_board(move)
-            new_node = MCTSNode(new_state, new_valid_moves, 1 - self.root.player, self.root)
-            self.root.children.append(new_node)
+        book_move = self.book.lookup(state) if self.book is not None else None
+        if book_move is not None:
+            if self.verbose >= 1:
+                print('THE NEXT MOVE IS IN THE OPENING BOOK')
+            if self.last_stats is not None:
+                self.last_stats.book_move = True
+                self._send_stats()
+            return book_move
+
+        if self.n_workers > 1:
+            self.root = self.tree.add_root(state, self.player)
+            self.tree.add_children(self.root, mask_to_moves(valid_moves))
+            move = self._select_best_move(self._build_strategy_parallel(time_budget_ms, node_budget))
+            self._send_stats()
+            return move
+
+        node = self.tree.find(state) if self.reuse_tree and len(self.tree) > 0 else None
+        if node is not None:
+            self.root = self.tree.reroot(node)
+            self.reused_visits = int(self.tree.N[self.root])
+        else:
+            self.root = self.tree.add_root(state, self.player)
+            self.reused_visits = 0
+        if self.tree.n_slots[self.root] == 0:
+            if self.rave_k is not None:
+                self.tree.add_children(self.root, mask_to_moves(valid_moves))
+            else:
+                self.tree.reserve(self.root, valid_moves)
 
-        v_scores = self._build_strategy()
+        if self.verbose >= 1:
+            print(f'REUSED VISITS: {self.reused_visits}')
+
+        v_scores = self._build_strategy(time_budget_ms, node_budget)
+        self._send_stats()
         
         return self._select_best_move(v_scores)
 
+    def _send_stats(self):
+        stats = self.last_stats
+        if stats is None:
+            return
+        searched = not (stats.root_forced or stats.book_move)
+        stats.time_ms = self.search_time_ms if searched else 0.0
+        stats.iterations = self.iterations_done if searched else 0
+        if searched:
+            stats.reused_visits = self.reused_visits
+            root_edges = self.tree.edges(self.root)
+            N, V = self.tree.edge_N[root_edges], self.tree.edge_V[root_edges]
+            for move, visits, value in zip(self.tree.move[root_edges], N, self._average_values(V, N)):
+                stats.child_visits[int(move)] = int(visits)
+                stats.child_values[int(move)] = float(value)
+        if self.stats_sink is not None:
+            self.stats_sink(stats)
+
     def _select_best_move(self, scores):
-        return self.root.valid_moves[np.array(scores).argmax()]
+        return int(self.tree.move[self.tree.edges(self.root)][np.array(scores).argmax()])
 
-    def _build_strategy(self):
+    def _build_strategy(self, time_budget_ms=None, node_budget=None):
         
-        num_iterations = len(self.root.valid_moves)*config.N_ITERATIONS_PER_MOVE
-        for iteration in range(num_iterations):
-            if self.verbose >= 2:
+        tree = self.tree
+        start = time.perf_counter()
+
+        if node_budget is not None:
+            num_iterations = node_budget
+        elif time_budget_ms is not None:
+            num_iterations = math.inf
+        else:
+            num_iterations = int(tree.n_slots[self.root])*config.N_ITERATIONS_PER_MOVE
+        deadline = start + time_budget_ms / 1000 if time_budget_ms is not None else math.inf
+
+        # checked once here, so that a search without verbose output or statistics pays almost nothing for them
+        debug = self.verbose >= 2
+        stats = self.last_stats
+        solver = self.solver
+        nodes_before = len(tree)
+
+        iteration = 0
+        # the root only gets proven when a proof is propagated, it is checked after those alone
+        root_proven = solver and tree.proven[self.root] != tree.UNKNOWN
+        while not root_proven and iteration < num_iterations and time.perf_counter() < deadline:
+            iteration += 1
+            if debug:
                 print()
-                print(f'CURRENT UCB: {[compute_ucb(leaf) for leaf in self.root.children]}')
+                root_edges = tree.edges(self.root)
+                print(f'CURRENT UCB: {list(compute_ucb(tree.edge_V[root_edges], tree.edge_N[root_edges], tree.N[self.root]))}')
                 print('SELECTING')
 
-            leaf = self._select()
+            if stats is not None:
+                t0 = time.perf_counter()
+            leaf, path = self._select()
+            if stats is not None:
+                t1 = time.perf_counter()
             
-            if self.verbose >= 2:
-                #print(f'SELECTED NODE: {display_board(leaf.state, self.size)}\n')
+            if debug:
                 print(f'SELECTED NODE:')
-                display_board(leaf.state, self.size)
+                display_board(tree.state(leaf), self.size)
                 print('EXPANDING')
             
-            leaf = self._expand(leaf)
+            leaf = self._expand(leaf, path)
+            if stats is not None:
+                t2 = time.perf_counter()
 
-            if self.verbose >= 2:
+            if debug:
                 print(f'EXPANSION DONE\n')
                 print(f'SIMULATING')
 
-            result = self._simulate(leaf.state, leaf.valid_moves, leaf.player)
+            proven_leaf = solver and tree.proven.item(leaf) != tree.UNKNOWN
+            if proven_leaf:
+                # no rollout needed, every simulation would end with the proven value
+                result = self._proven_result(leaf) * self.rollouts_per_leaf
+                self.rollout_plies = self.rollout_forced = self.rollout_max_plies = 0
+                self.rollout_moves = (0, 0)
+            elif self.rollouts_per_leaf > 1:
+                result = self._simulate_batch(tree.state(leaf), int(tree.player[leaf]), self.rollouts_per_leaf)
+            else:
+                result = self._simulate(tree.state(leaf), tree.valid_moves(leaf, self.size), int(tree.player[leaf]))
+            if stats is not None:
+                t3 = time.perf_counter()
 
-            if self.verbose >= 2:
+            if debug:
                 print(f'SIMULATION OVER. RESULT: {result}\n')
                 print(f'BACKPROPAGATING\n')
 
-            self._backpropagate(leaf, result)
+            self._backpropagate(path, result, self.rollouts_per_leaf, proven_leaf)
+            if proven_leaf:
+                root_proven = tree.proven.item(self.root) != tree.UNKNOWN
+
+            if stats is not None:
+                t4 = time.perf_counter()
+                phase_time = stats.phase_time
+                phase_time['select'] += t1 - t0
+                phase_time['expand'] += t2 - t1
+                phase_time['simulate'] += t3 - t2
+                phase_time['backpropagate'] += t4 - t3
+                stats.total_depth += self.selection_depth
+                stats.max_depth = max(stats.max_depth, self.selection_depth)
+                stats.rollouts += 0 if proven_leaf else self.rollouts_per_leaf
+                stats.rollout_plies += self.rollout_plies
+                stats.max_rollout_length = max(stats.max_rollout_length, self.rollout_max_plies)
+                stats.forced_moves += self.rollout_forced
+
+        if root_proven:
+            if self.verbose >= 1:
+                print(f'ROOT PROVEN: {tree.proven[self.root]}')
+            if stats is not None:
+                stats.root_proven = True
+        if stats is not None:
+            stats.nodes_allocated = len(tree) - nodes_before
+            stats.proven_nodes = int((tree.proven[:len(tree)] != tree.UNKNOWN).sum())
+
+        # with a tiny budget the root may still have no child, one is picked at random
+        if tree.n_edges[self.root] == 0:
+            tree.add_child(self.root, random_move(int(tree.untried[self.root]), self.random))
+
+        self.iterations_done = iteration
+        self.search_time_ms = (time.perf_counter() - start) * 1000
+        if self.verbose >= 1:
+            print(f'ITERATIONS: {self.iterations_done}, TIME: {self.search_time_ms:.1f}ms')
+            self._print_strategy()
+
+        return [self._root_values()]
+
+    def _root_values(self):
+        """Average values of the root children, replaced by the proven values where there are some."""
+
+        tree = self.tree
+        root_edges = tree.edges(self.root)
+        values = self._average_values(tree.edge_V[root_edges], tree.edge_N[root_edges])
+        if self.solver:
+            proven = tree.proven[tree.child[root_edges]]
+            values = np.where(proven == -1, math.inf, values)
+            values = np.where(proven == 0, config.TIE_SCORE, values)
+            values = np.where(proven == 1, -math.inf, values)
+        return values
+
+    def _proven_result(self, node):
+        """Result of a simulation from a proven node, for our player."""
+        value = int(self.tree.proven[node])
+        if self.tree.player[node] != self.player:
+            value = -value
+        return {1: config.WIN_SCORE, 0: config.TIE_SCORE, -1: config.LOSE_SCORE}[value]
+
+    @staticmethod
+    def _average_values(V, N):
+        # children that the search had no time to visit are never chosen
+        return np.where(N > 0, V / np.maximum(N, 1), -math.inf)
+
+    def _build_strategy_parallel(self, time_budget_ms=None, node_budget=None):
+        """
+        Runs n_workers searches from the root in the process pool, each with its own seed,
+        and stores the summed N and V of the root edges in the tree, together with the proofs of
+        the root children found by any of the workers (a proof holds whatever the search that found it).
+        """
 
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers)
+
+        tree = self.tree
+        root_edges = tree.edges(self.root)
+        start = time.perf_counter()
+        state, moves = tree.state(self.root), [int(move) for move in tree.move[root_edges]]
+        seeds = self.rng.integers(2 ** 63, size=self.n_workers)
+        futures = [self._executor.submit(_root_search, self.size, self.winning_configurations, self.player, self.rollouts_per_leaf,
+                                         state, moves, int(seed), time_budget_ms, node_budget, self.rave_k,
+                                         self.rave_exploration, self.solver) for seed in seeds]
+        self.iterations_done = 0
+        children = tree.child[root_edges]
+        for future in futures:
+            N, V, proven, iterations = future.result()
+            tree.edge_N[root_edges] += N
+            tree.edge_V[root_edges] += V
+            tree.proven[children] = np.where(proven != tree.UNKNOWN, proven, tree.proven[children])
+            self.iterations_done += iterations
+        tree.N[self.root] = tree.edge_N[root_edges].sum()
+
+        self.search_time_ms = (time.perf_counter() - start) * 1000
         if self.verbose >= 1:
-            print(f'Results of Strategy:\n')
-            for i, move in enumerate(self.root.valid_moves):
-                leaf = self.root.children[i]
-                print(f'Move: {move}:\n')
-                print(f'\tUCB Score: {compute_ucb(leaf)}')
-                print(f'\tAverage Value: {leaf.V/leaf.N}')
-                print(f'\t# of Times Visited: {leaf.N}')
-
-        return [[leaf.V/leaf.N for leaf in self.root.children]]
+            print(f'ITERATIONS: {self.iterations_done}, TIME: {self.search_time_ms:.1f}ms')
+            self._print_strategy()
+
+        return [self._root_values()]
+
+    def _print_strategy(self):
+        tree = self.tree
+        root_edges = tree.edges(self.root)
+        N, V = tree.edge_N[root_edges], tree.edge_V[root_edges]
+        print(f'Results of Strategy:\n')
+        ucb = compute_ucb(V, N, tree.N[self.root])
+        for i, move in enumerate(tree.move[root_edges]):
+            print(f'Move: {move}:\n')
+            print(f'\tUCB Score: {ucb[i]}')
+            print(f'\tAverage Value: {V[i]/N[i]}')
+            print(f'\t# of Times Visited: {N[i]}')
     
     def _select(self):
         """
-        Select the best leaf node to expand.
+        Select the best leaf node to expand, returns it together with the path of edges that leads to it.
+        The descent stops at the first node that still has an untried move it is allowed to try.
         """
 
+        tree = self.tree
         leaf = self.root
+        path = []
+        widening_c, widening_alpha = self.widening_c, self.widening_alpha
+        solver = self.solver
 
-        while leaf.children != []:
-            
-            best_child = np.array([compute_ucb(child) for child in leaf.children]).argmax()
+        while tree.n_edges[leaf] > 0:
+
+            if solver and tree.proven.item(leaf) != tree.UNKNOWN:
+                break
 
-            leaf = leaf.children[best_child]
+            if tree.untried[leaf] and (widening_c is None or tree.n_edges[leaf] < widening_c * tree.N[leaf] ** widening_alpha):
+                break
+            
+            edges = tree.edges(leaf)
+            if self.rave_k is None:
+                scores = compute_ucb(tree.edge_V[edges], tree.edge_N[edges], tree.N[leaf])
+            else:
+                scores = compute_rave_ucb(tree.edge_V[edges], tree.edge_N[edges], tree.amaf_V[edges], tree.amaf_N[edges], tree.N[leaf],
+                                          self.rave_k, self.rave_exploration)
+            if solver and tree.proven_child.item(leaf):
+                # children proven won for the opponent are never worth a visit
+                scores[tree.proven[tree.child[edges]] == 1] = -math.inf
+            best_edge = edges.start + int(scores.argmax())
+
+            path.append(best_edge)
+            leaf = int(tree.child[best_edge])
         
-        return leaf
+        self.selection_depth = len(path)
+        return leaf, path
 
-    def _expand(self, leaf):
+    def _expand(self, leaf, path):
         """
-        Expand the leaf node by adding all possible children.
+        Expand the leaf node by adding the child of one of its untried moves, picked at random.
+        The moves of a node are listed on its first expansion. The edge to the new child is appended to path.
         """
 
-        if leaf.N == 0 or leaf.valid_moves == [] or is_win(leaf.state, self.winning_configurations):
+        tree = self.tree
+        if tree.N[leaf] == 0 or tree.proven[leaf] != tree.UNKNOWN:
+            if self.verbose >= 2:
+                print('LEAF NOT VISITED OR LEAF IS TERMINAL STAGE. NOT EXPANDING')
+            return leaf
+
+        if tree.n_slots[leaf] > 0:
+            edge = tree.add_child(leaf, random_move(int(tree.untried[leaf]), self.random))
+            path.append(edge)
+            return int(tree.child[edge])
+
+        state = GameState(self.line_index, tree.state(leaf))
+        valid_moves = tree.valid_moves(leaf, self.size)
+
+        if state.is_over():
             
             if self.verbose >= 2:
                 print('LEAF NOT VISITED OR LEAF IS TERMINAL STAGE. NOT EXPANDING')
 
+            if self.solver:
+                # the player to move has lost if the last move won, otherwise the board is full
+                tree.proven[leaf] = -1 if state.winner else 0
             return leaf
         
         if self.verbose >= 2:
-            print(f'LEAF: {display_board(leaf.state, self.size)}')
-            print(f'LEFT MOVES: {leaf.valid_moves}')
-
-        if is_move_forced(leaf.state, self.winning_configurations, self.size) is not None:
-            move = is_move_forced(leaf.state, self.winning_configurations, self.size)
-            new_state, new_valid_moves = leaf.update_board(move)
-            new_node = MCTSNode(new_state, new_valid_moves, 1 - leaf.player, leaf)
-            leaf.children.append(new_node)
+            print(f'LEAF:')
+            display_board(state.grid, self.size)
+            print(f'LEFT MOVES: {mask_to_moves(valid_moves)}')
+
+        # a winning move comes before blocking the opponent, so that a node restricted to its forced move keeps its exact value
+        move = state.winning_move(int(tree.player[leaf]))
+        if move is not None:
+            if self.solver:
+                tree.proven[leaf] = 1
         else:
-            for move in leaf.valid_moves:
-                
-                new_state, new_valid_moves = leaf.update_board(move)
-                new_node = MCTSNode(new_state, new_valid_moves, 1 - leaf.player, leaf)
+            move = state.forced_move()
+        moves = 1 << move if move is not None else valid_moves
+        if self.rave_k is not None:
+            # every child exists from the start, so that they all collect AMAF statistics
+            first = tree.add_children(leaf, mask_to_moves(moves))
+            edge = first + self.random.randrange(popcount(moves))
+        else:
+            tree.reserve(leaf, moves)
+            edge = tree.add_child(leaf, random_move(int(tree.untried[leaf]), self.random))
+        path.append(edge)
+        return int(tree.child[edge])
 
-                leaf.children.append(new_node)
 
-        return leaf.children[0]
+    def _simulate(self, board, valid_moves, player):
+        """ Rollout a game from the given node, valid_moves being the bitmask of the empty cells """
 
+        state = GameState(self.line_index, board)
+        self.rollout_plies = 0
+        self.rollout_forced = 0
+        played = [0, 0]
 
-    def _simulate(self, board, valid_moves, player):
-        """ Rollout a game from the given node """
+        while not state.is_over():
 
-        if self.verbose >= 2:
-            print()
-            print(f'board in simulation:')
-            display_board(board, self.size)
-            print(f'valid moves {valid_moves}')
+            if self.verbose >= 2:
+                print()
+                print(f'board in simulation:')
+                display_board(state.grid, self.size)
+                print(f'valid moves {mask_to_moves(valid_moves)}')
 
-        if is_win(board, self.winning_configurations) == (self.player + 1):
+            move = state.forced_move()
+            if move is not None:
+                self.rollout_forced += 1
+                if self.verbose >= 2:
+                    print(f'MOVE FORCED: {move}')
+            else:
+                move = random_move(valid_moves, self.random)
+            valid_moves &= ~(1 << move)
+            played[player] |= 1 << move
+            state.play(move, player)
+            player = 1 - player
+            self.rollout_plies += 1
+        self.rollout_max_plies = self.rollout_plies
+        self.rollout_moves = tuple(played)
+
+        if state.winner == self.player + 1:
             if self.verbose >= 2:
                 print('WIN FOR PLAYER')
             return config.WIN_SCORE
-        elif is_win(board, self.winning_configurations) == 2 and self.player == 0:
-            if self.verbose >= 2:
-                print('LOSS FOR PLAYER')
-            return config.LOSE_SCORE
-        
-        elif is_win(board, self.winning_configurations) == 1 and self.player == 1:
+        elif state.winner != 0:
             if self.verbose >= 2:
                 print('LOSS FOR PLAYER')
             return config.LOSE_SCORE
-        
-        elif is_full(board, self.size):
+        else:
             if self.verbose >= 2:
                 print('TIE')
             return config.TIE_SCORE
-        
-        else:
-            
-            if is_move_forced(board, self.winning_configurations, self.size) is not None:
-                move = is_move_forced(board, self.winning_configurations, self.size)
-                if self.verbose >= 2:
-                    print(f'MOVE FORCED: {move}')
-            else:
-                move = random.choice(valid_moves)
-            next_player_board = board[player] | (1 << move)
-            if player == 0:
-                next_board = (next_player_board, board[1])
+
+
+    def _simulate_batch(self, board, player, n_rollouts):
+        """ Rollout n_rollouts games at once from the given node, returns the sum of their results """
+
+        counters = {}
+        wins0, wins1, draws = batch_rollouts(board, player, n_rollouts, self.winning_configurations, self.size, self.rng, counters)
+        self.rollout_plies, self.rollout_forced, self.rollout_max_plies = counters['plies'], counters['forced'], counters['max_plies']
+        wins, losses = (wins0, wins1) if self.player == 0 else (wins1, wins0)
+        return wins * config.WIN_SCORE + losses * config.LOSE_SCORE + draws * config.TIE_SCORE
+
+    def _backpropagate(self, path, result, visits=1, proven_leaf=False):
+        """
+        Update the statistics of the root and of the edges and nodes along path,
+        result being the sum of the results of visits simulations.
+        Only the path that was followed is updated, not every parent of a shared node.
+        With proven_leaf, the proof of the last node of path is propagated too.
+        """
+
+        tree = self.tree
+        tree.N[self.root] += visits
+        for edge in path:
+            child = tree.child[edge]
+            tree.N[child] += visits
+            tree.edge_N[edge] += visits
+            if self.player != tree.player[child]:
+                tree.edge_V[edge] += result
             else:
-                next_board = (board[0], next_player_board)
-            remaining_valid_moves = valid_moves.copy()
-            remaining_valid_moves.remove(move)
+                tree.edge_V[edge] -= result
 
+        if self.rave_k is not None:
+            self._backpropagate_amaf(path, result)
+        if proven_leaf:
+            self._backpropagate_proof(path)
 
-            return self._simulate(next_board, remaining_valid_moves, 1 - player)
+    def _backpropagate_proof(self, path):
+        """
+        Propagates the proof of the last node of path, which is proven, towards the root, as long as the parents
+        become proven: a node is won if one of its children is lost for the player to move there, and has the best
+        value of its children once they are all created and proven.
+        """
 
+        tree = self.tree
+        nodes = [self.root] + [int(tree.child[edge]) for edge in path[:-1]]
+        for node in reversed(nodes):
+            tree.proven_child[node] = True
+            if tree.proven[node] != tree.UNKNOWN:
+                continue
+            # a handful of values, compared faster as a list
+            values = tree.proven[tree.child[tree.edges(node)]].tolist()
+            if -1 in values:
+                tree.proven[node] = 1
+            elif tree.untried[node] == 0 and tree.UNKNOWN not in values:
+                tree.proven[node] = -min(values)
+            else:
+                return
 
-    def _backpropagate(self, node, result):
-        """ Update the node statistics """
+    def _backpropagate_amaf(self, path, result):
+        """
+        Credits the result to the AMAF statistics of the edges of every node along path whose move was played
+        later in the simulation, in the tree or in the rollout, by the player to move at that node.
+        The edges of all the nodes of the path are updated at once.
+        """
 
-        node.N += 1
-        if self.player != node.player:
-            node.V += result
-        else:
-            node.V -= result
-        
-        if node.parent is not None:
-            self._backpropagate(node.parent, result)
-
-    def print_tree(self, node, indent=0):
-        print(" " * indent + str(node.status))
-        # Recursively print each child, increasing the indentation.
-        for child in node.children:
-            self.print_tree(child, indent + 4)
+        tree = self.tree
+        played = list(self.rollout_moves)
+        parents = [self.root] + [int(tree.child[edge]) for edge in path[:-1]]
+        masks, signs = [0] * len(path), [0] * len(path)
+        for depth in range(len(path) - 1, -1, -1):
+            player = int(tree.player[parents[depth]])
+            played[player] |= 1 << int(tree.move[path[depth]])
+            masks[depth] = played[player]
+            signs[depth] = result if self.player == player else -result
+
+        # the edge slices of the parents, concatenated
+        first, counts = tree.first_edge[parents], tree.n_edges[parents]
+        edges = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        credited = (np.repeat(np.array(masks, dtype=np.int64), counts) >> tree.move[edges]) & 1 == 1
+        # a node appears once on a path, so no edge is repeated
+        tree.amaf_N[edges[credited]] += 1
+        tree.amaf_V[edges[credited]] += np.repeat(np.array(signs, dtype=np.float64), counts)[credited]
+
+    def print_tree(self, node=None, indent=0):
+        if node is None:
+            node = self.root
+            print(f'root, N: {self.tree.N[node]}')
+        # Recursively print each child, increasing the indentation. Shared nodes are printed once per path.
+        for edge in range(self.tree.edges(node).start, self.tree.edges(node).stop):
+            print(" " * (indent + 4) + f'move: {self.tree.move[edge]}, N: {self.tree.edge_N[edge]}, V: {self.tree.edge_V[edge]}')
+            self.print_tree(int(self.tree.child[edge]), indent + 4)
+
+
+_worker_bots = {} # bots kept by each worker process of the pool, one per board and player
+
+def _root_search(size, winning_configurations, player, rollouts_per_leaf, state, moves, seed, time_budget_ms=None, node_budget=None, rave_k=None,
+                 rave_exploration=config.MCTS_RAVE_EXPLORATION, solver=config.MCTS_SOLVER):
+    """
+    Single threaded search from state run by a worker, returns N and V of the root edges, the proven values
+    of the root children and the iterations run.
+    """
+
+    key = (size, tuple(winning_configurations), player, rollouts_per_leaf, rave_k, rave_exploration, solver)
+    if key not in _worker_bots:
+        _worker_bots[key] = MCTSBot(size, winning_configurations, player, reuse_tree=False, rollouts_per_leaf=rollouts_per_leaf, n_workers=1,
+                                    rave_k=rave_k, rave_exploration=rave_exploration, solver=solver)
+    bot = _worker_bots[key]
+    bot.random.seed(seed)
+    bot.rng = np.random.default_rng(seed)
+
+    bot.root = bot.tree.add_root(state, player)
+    bot.tree.add_children(bot.root, moves)
+    bot._build_strategy(time_budget_ms, node_budget)
+    root_edges = bot.tree.edges(bot.root)
+    return (bot.tree.edge_N[root_edges].copy(), bot.tree.edge_V[root_edges].copy(), bot.tree.proven[bot.tree.child[root_edges]],
+            bot.iterations_done)
\ No newline at end of file
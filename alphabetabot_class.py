@@ -0,0 +1,160 @@
+from utils import *
+import time
+
+import config
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBetaBot:
+
+    WIN_VALUE = 10 ** 6
+
+    def __init__(self, size, winning_configurations, player=0, time_budget_ms=config.AB_TIME_BUDGET_MS, max_depth=None, verbose=0):
+        """
+        Negamax search with alpha-beta pruning and iterative deepening.
+        - time_budget_ms: time allowed for each move, the deepest completed iteration is played.
+        - max_depth: optional cap on the search depth (None means up to the end of the game).
+        """
+        self.name = 'AlphaBetaBot'
+        self.size = size
+        self.winning_configurations = winning_configurations
+        self.player = player
+        self.time_budget_ms = time_budget_ms
+        self.max_depth = max_depth
+        self.verbose = verbose
+
+        # lines going through each cell, so that only those are checked after a move
+        self.cell_lines = [[mask for mask in winning_configurations if mask & (1 << cell)] for cell in range(size * size)]
+        # value of a line that contains only marks of one player, by number of marks
+        line_length = max(popcount(mask) for mask in winning_configurations)
+        self.line_values = [0] + [4 ** n_marks for n_marks in range(1, line_length + 1)]
+
+        self.transpositions = {}
+        self.history = [0] * (size * size)
+        self.nodes = 0
+        self.deadline = None
+
+    def __str__(self):
+        return self.name
+
+    def next_move(self, current_state, valid_moves):
+        """valid_moves is a bitmask of moves or a list of them."""
+        grid = tuple(current_state)
+        player = 0 if popcount(grid[0]) == popcount(grid[1]) else 1
+        moves = mask_to_moves(as_move_mask(valid_moves))
+
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget_ms / 1000
+        self.transpositions = {}
+        self.history = [0] * (self.size * self.size)
+        self.nodes = 0
+
+        max_depth = len(moves) if self.max_depth is None else min(self.max_depth, len(moves))
+        best_move = self._order_moves(grid, moves, None)[0]
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._search_root(grid, player, moves, depth)
+            except SearchTimeout:
+                break
+            best_move = move
+            if self.verbose >= 1:
+                print(f'DEPTH {depth}: MOVE {move}, SCORE {score}, NODES {self.nodes}, TIME {(time.perf_counter() - start) * 1000:.0f}ms')
+            # the result of the game is known, searching deeper cannot change it
+            if abs(score) >= self.WIN_VALUE - self.size * self.size:
+                break
+
+        return best_move
+
+    def _search_root(self, grid, player, moves, depth):
+        alpha, beta = -math.inf, math.inf
+        best_move = None
+        for move in self._order_moves(grid, moves, self._stored_move(grid)):
+            score = -self._negamax(play_move(grid, player, move), 1 - player, move, depth - 1, -beta, -alpha, 1)
+            if score > alpha:
+                alpha, best_move = score, move
+        self.transpositions[grid] = (depth, alpha, 0, best_move)
+        return alpha, best_move
+
+    def _negamax(self, grid, player, last_move, depth, alpha, beta, ply):
+        """
+        Value of the grid for the player that has to move.
+        last_move was played by the opponent, so only the lines through it can have been completed.
+        """
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        opponent_conf = grid[1 - player]
+        for mask in self.cell_lines[last_move]:
+            if opponent_conf & mask == mask:
+                return -(self.WIN_VALUE - ply)
+        if is_full(grid, self.size):
+            return 0
+        if depth == 0:
+            return self._evaluate(grid, player)
+
+        # transposition entries: (depth, value, bound, best move), bound is 0 for exact, -1 for upper, 1 for lower
+        original_alpha = alpha
+        entry = self.transpositions.get(grid)
+        if entry is not None and entry[0] >= depth:
+            if entry[2] == 0:
+                return entry[1]
+            if entry[2] == 1:
+                alpha = max(alpha, entry[1])
+            else:
+                beta = min(beta, entry[1])
+            if alpha >= beta:
+                return entry[1]
+
+        moves = mask_to_moves(empty_cells(grid, self.size))
+
+        best_score, best_move = -math.inf, None
+        for move in self._order_moves(grid, moves, entry[3] if entry is not None else None):
+            score = -self._negamax(play_move(grid, player, move), 1 - player, move, depth - 1, -beta, -alpha, ply + 1)
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.history[move] += depth * depth
+                break
+
+        bound = 0
+        if best_score <= original_alpha:
+            bound = -1
+        elif best_score >= beta:
+            bound = 1
+        self.transpositions[grid] = (depth, best_score, bound, best_move)
+        return best_score
+
+    def _stored_move(self, grid):
+        entry = self.transpositions.get(grid)
+        return entry[3] if entry is not None else None
+
+    def _order_moves(self, grid, moves, first_move):
+        """
+        The move stored in the transposition table goes first, then moves that caused cutoffs
+        and moves lying on many lines that are still open.
+        """
+        conf0, conf1 = grid
+        def priority(move):
+            open_lines = sum(1 for mask in self.cell_lines[move] if not (conf0 & mask and conf1 & mask))
+            return (move != first_move, -self.history[move], -open_lines)
+        return sorted(moves, key=priority)
+
+    def _evaluate(self, grid, player):
+        """
+        Heuristic value of a non terminal grid for the player that has to move:
+        every line that is still open counts for the player that owns all its marks.
+        """
+        own, other = grid[player], grid[1 - player]
+        score = 0
+        for mask in self.winning_configurations:
+            if own & mask:
+                if not other & mask:
+                    score += self.line_values[popcount(own & mask)]
+            elif other & mask:
+                score -= self.line_values[popcount(other & mask)]
+        return score
\ No newline at end of file
@@ -0,0 +1,181 @@
+import numpy as np
+
+from utils import create_symmetries, invert_symmetry, create_symmetry_tables
+from strategy_table import StrategyTable, level_arrays, canonical_keys
+from batch_rollouts import popcount, forced_bits, random_empty_bits
+
+
+class BatchGames:
+    """
+    n_games independent games played in lockstep, each board being a pair of int64 bitboards.
+    All games start from the empty board, so at every step the same player moves in every running game.
+    winner follows the convention of TicTacToe.automatic_games: 1 or 2 for a win of player 0 or 1,
+    0 for a draw, and -1 while the game is still running.
+    """
+
+    def __init__(self, size, winning_configurations, n_games):
+        if size * size > 62:
+            raise ValueError('Batched games support boards of at most 62 cells')
+
+        self.size = size
+        self.n_games = n_games
+        self.masks = np.array(winning_configurations, dtype=np.int64)
+        self.directions = getattr(winning_configurations, 'directions', None)
+        self.k = getattr(winning_configurations, 'k', size)
+        self.full = (1 << (size * size)) - 1
+
+        self.conf = np.zeros((2, n_games), dtype=np.int64)
+        self.winner = np.full(n_games, -1, dtype=np.int8)
+        self.n_moves = 0
+
+    @property
+    def player(self):
+        return self.n_moves % 2
+
+    def active(self):
+        return np.flatnonzero(self.winner < 0)
+
+    def empty(self, games):
+        return self.full & ~(self.conf[0, games] | self.conf[1, games])
+
+    def is_legal(self, games, moves):
+        moves = np.asarray(moves, dtype=np.int64)
+        in_board = (moves >= 0) & (moves < self.size * self.size)
+        return in_board & ((self.empty(games) >> np.where(in_board, moves, 0)) & 1).astype(bool)
+
+    def is_win(self, conf):
+        """Vectorized utils.is_win for the bitboards of one player."""
+        if self.directions is None:
+            return ((conf[:, None] & self.masks) == self.masks).any(axis=1)
+
+        won = np.zeros(len(conf), dtype=bool)
+        for shift, start_mask in self.directions:
+            run, length = conf, 1
+            while 2 * length <= self.k:
+                run = run & (run >> (shift * length))
+                length *= 2
+            if length < self.k:
+                run = run & (run >> (shift * (self.k - length)))
+            won |= (run & start_mask) != 0
+        return won
+
+    def is_full(self, games):
+        return (self.conf[0, games] | self.conf[1, games]) == self.full
+
+    def play(self, games, moves):
+        """Plays moves[i] in games[i] for the player to move, then updates the winners."""
+        moves = np.asarray(moves, dtype=np.int64)
+        legal = self.is_legal(games, moves)
+        if not legal.all():
+            raise ValueError(f'Illegal moves {moves[~legal][:10]} in games {games[~legal][:10]}')
+
+        player = self.player
+        self.conf[player, games] |= np.left_shift(1, moves)
+
+        won = self.is_win(self.conf[player, games])
+        self.winner[games[won]] = player + 1
+        self.winner[games[~won & self.is_full(games)]] = 0
+        self.n_moves += 1
+
+    def run(self, policy0, policy1):
+        """
+        Plays every game to the end, policy0 moving first.
+        Returns the number of draws and of wins of each player, keyed as in TicTacToe.automatic_games.
+        """
+        policies = [policy0, policy1]
+        games = self.active()
+        while len(games) > 0:
+            moves = policies[self.player](self.conf[0, games], self.conf[1, games], self.player)
+            self.play(games, moves)
+            games = games[self.winner[games] < 0]
+
+        counts = np.bincount(self.winner, minlength=3)
+        return {0: int(counts[0]), 1: int(counts[1]), 2: int(counts[2])}
+
+
+# A policy is called with the bitboards of a batch of running games and the player to move,
+# and returns one move per game.
+
+class RandomPolicy:
+
+    def __init__(self, size, seed=None):
+        self.name = 'RandomPolicy'
+        self.full = (1 << (size * size)) - 1
+        self.cells = np.arange(size * size, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, conf0, conf1, player):
+        return bit_cells(random_empty_bits(conf0, conf1, self.full, self.cells, self.rng))
+
+    def __str__(self):
+        return self.name
+
+
+class ForcedMovePolicy(RandomPolicy):
+    """The rollout policy of MCTSBot: complete or block a line when possible, otherwise play at random."""
+
+    def __init__(self, size, winning_configurations, seed=None):
+        super().__init__(size, seed)
+        self.name = 'ForcedMovePolicy'
+        self.masks = np.array(winning_configurations, dtype=np.int64)
+        self.missing_one = getattr(winning_configurations, 'k', size) - 1
+
+    def __call__(self, conf0, conf1, player):
+        has_forced, forced_bit = forced_bits(conf0, conf1, self.masks, self.missing_one)
+        random_bit = random_empty_bits(conf0, conf1, self.full, self.cells, self.rng)
+        return bit_cells(np.where(has_forced, forced_bit, random_bit))
+
+
+class TablePolicy(RandomPolicy):
+    """
+    Plays the moves of a solved ESBot strategy, looking up a whole batch of positions at once:
+    the boards are canonicalized with vectorized symmetry tables and searched in the sorted keys
+    of each level. Positions with no stored move (lost or missing ones) get a random move.
+    """
+
+    def __init__(self, esbot, seed=None):
+        super().__init__(esbot.size, seed)
+        self.name = 'TablePolicy'
+        self.size = esbot.size
+        self.n_cells = esbot.size * esbot.size
+        if 2 * self.n_cells > 62:
+            raise ValueError(f'Grids of size {esbot.size} do not fit in a 64 bit key')
+
+        symmetries = create_symmetries(self.size)
+        self.symmetry_tables = np.array(create_symmetry_tables(symmetries), dtype=np.int64)
+        self.inverse_symmetries = np.array([invert_symmetry(symmetry) for symmetry in symmetries], dtype=np.int64)
+
+        strategy = esbot.strategy
+        if strategy is None:
+            raise ValueError('TablePolicy needs the solved strategy of ESBot, not a lazy ESBot')
+        if isinstance(strategy, StrategyTable):
+            self.levels = [(level.keys, level.packed) for level in strategy.levels]
+        else:
+            self.levels = [level_arrays(strategy.get(n, {}), self.size) for n in range(self.n_cells + 1)]
+
+    def __call__(self, conf0, conf1, player):
+        keys, symmetry = canonical_keys(conf0, conf1, self.symmetry_tables, self.n_cells)
+        keys = keys.astype(np.uint64)
+
+        moves = np.full(len(conf0), -1, dtype=np.int64)
+        n_moves = popcount(conf0 | conf1).astype(np.int64)
+        for n in np.unique(n_moves):
+            in_level = np.flatnonzero(n_moves == n)
+            level_keys, level_packed = self.levels[n]
+            if len(level_keys) == 0:
+                continue
+            index = np.minimum(np.searchsorted(level_keys, keys[in_level]), len(level_keys) - 1)
+            found = level_keys[index] == keys[in_level]
+            moves[in_level[found]] = (level_packed[index[found]].astype(np.int64) >> 2) - 1
+
+        stored = moves >= 0
+        # the stored move refers to the canonical grid, send it back to the orientation of each board
+        moves[stored] = self.inverse_symmetries[symmetry[stored], moves[stored]]
+        if not stored.all():
+            moves[~stored] = super().__call__(conf0[~stored], conf1[~stored], player)
+        return moves
+
+
+def bit_cells(bits):
+    """Index of the single set bit of each value."""
+    return popcount(bits - 1).astype(np.int64)
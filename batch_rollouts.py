@@ -0,0 +1,93 @@
+import numpy as np
+
+from utils import is_win, is_full
+
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+    def popcount(x):
+        x = np.asarray(x, dtype=np.int64)
+        counts = np.zeros(x.shape, dtype=np.uint8)
+        for shift in range(0, 64, 8):
+            counts += _BYTE_COUNTS[(x >> shift) & 255]
+        return counts
+
+
+def forced_bits(conf0, conf1, masks, missing_one):
+    """
+    Vectorized is_move_forced: for each pair of bitboards tells whether some line has all cells but one
+    taken by a player and none by the other, and returns the bit of the missing cell of the first such line.
+    """
+    count0 = popcount(conf0[:, None] & masks)
+    count1 = popcount(conf1[:, None] & masks)
+    forced0 = (count0 == missing_one) & (count1 == 0)
+    forced1 = (count1 == missing_one) & (count0 == 0)
+    forced = forced0 | forced1
+    first_line = forced.argmax(axis=1)
+    rows = np.arange(len(conf0))
+    forced_bit = np.where(forced0[rows, first_line], masks[first_line] & ~conf0, masks[first_line] & ~conf1)
+    return forced.any(axis=1), forced_bit
+
+def random_empty_bits(conf0, conf1, full, cells, rng):
+    """Bit of a uniformly random empty cell of each board, picked as the r-th empty cell."""
+    empty = ((full & ~(conf0 | conf1))[:, None] >> cells) & 1
+    r = rng.integers(0, empty.sum(axis=1))
+    return np.left_shift(1, (np.cumsum(empty, axis=1) > r[:, None]).argmax(axis=1))
+
+
+def batch_rollouts(board, player, n_rollouts, winning_configurations, size, rng, counters=None):
+    """
+    Plays n_rollouts games from board at the same time, player being the one that has to move.
+    The policy is the one of MCTSBot._simulate: if is_move_forced finds a line to complete or block
+    that move is played, otherwise a random empty cell is picked.
+    Returns the number of games won by player 0, won by player 1 and drawn.
+    If a counters dict is given, the total number of plies and of forced moves played are stored in it,
+    together with the length of the longest game.
+    """
+
+    if size * size > 62:
+        raise ValueError('Batched rollouts support boards of at most 62 cells')
+
+    winner = is_win(board, winning_configurations)
+    if counters is not None:
+        counters['plies'], counters['forced'], counters['max_plies'] = 0, 0, 0
+    if winner:
+        return (n_rollouts, 0, 0) if winner == 1 else (0, n_rollouts, 0)
+    if is_full(board, size):
+        return (0, 0, n_rollouts)
+
+    masks = np.array(winning_configurations, dtype=np.int64)
+    missing_one = getattr(winning_configurations, 'k', size) - 1
+    full = (1 << (size * size)) - 1
+    cells = np.arange(size * size, dtype=np.int64)
+
+    boards = np.empty((2, n_rollouts), dtype=np.int64)
+    boards[0], boards[1] = board
+    wins = [0, 0]
+
+    active = np.arange(n_rollouts)
+    while len(active) > 0:
+        conf0, conf1 = boards[0, active], boards[1, active]
+
+        has_forced, forced_bit = forced_bits(conf0, conf1, masks, missing_one)
+        random_bit = random_empty_bits(conf0, conf1, full, cells, rng)
+
+        bit = np.where(has_forced, forced_bit, random_bit)
+        if counters is not None:
+            counters['plies'] += len(active)
+            counters['forced'] += int(has_forced.sum())
+            # the games all start together, the longest one is still active at every ply
+            counters['max_plies'] += 1
+        boards[player, active] |= bit
+
+        new_conf = boards[player, active]
+        won = ((new_conf[:, None] & masks) == masks).any(axis=1)
+        wins[player] += int(won.sum())
+        over = won | ((boards[0, active] | boards[1, active]) == full)
+        active = active[~over]
+        player = 1 - player
+
+    return wins[0], wins[1], n_rollouts - wins[0] - wins[1]
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Micro-benchmarks of the engine hot paths.
+
+    python benchmarks.py                          run and print the results
+    python benchmarks.py --save bench_baseline.json   store them as a baseline
+    python benchmarks.py --compare bench_baseline.json   flag regressions against a baseline
+
+Refresh the baseline (--save, with --runs 3 or more on a noisy machine) in the commit that changes a benchmark
+on purpose, so that --compare keeps flagging only the changes nobody meant to make.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+
+from utils import *
+from game_state import LineIndex, GameState
+from batch_rollouts import batch_rollouts
+from esbot_class import ESBot
+from retrograde_solver import solve_to_file
+from strategy_table import strategy_path
+from MCSTBot_class import MCTSBot, MCTSTree
+
+
+def best_time(function, repeat=7, number=None, min_time=0.1):
+    """Best time per call of function over repeat runs, each run calling it number times (chosen to last at least min_time)."""
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            if time.perf_counter() - start >= min_time:
+                break
+            number *= 2
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def random_positions(size, winning_configurations, n_positions, seed=0):
+    """Positions reached by random games that are not over yet."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < n_positions:
+        grid, player = (0, 0), 0
+        for _ in range(rng.randint(0, size * size - 1)):
+            grid = play_move(grid, player, random_move(empty_cells(grid, size), rng))
+            player = 1 - player
+            if is_win(grid, winning_configurations):
+                break
+        if not is_win(grid, winning_configurations) and not is_full(grid, size):
+            positions.append((grid, player))
+    return positions
+
+
+def bench_primitives(results, sizes):
+    for size in sizes:
+        winning_configurations = create_win_grids(size)
+        positions = random_positions(size, winning_configurations, 200)
+        grids = [grid for grid, _ in positions]
+        index = LineIndex(size, winning_configurations)
+        states = [GameState(index, grid) for grid in grids]
+        moves = [next(iter_moves(empty_cells(grid, size))) for grid in grids]
+
+        def over_positions(function):
+            return lambda: [function(i) for i in range(len(grids))]
+
+        timings = {
+            'is_win': over_positions(lambda i: is_win(grids[i], winning_configurations)),
+            'is_full': over_positions(lambda i: is_full(grids[i], size)),
+            'is_move_forced': over_positions(lambda i: is_move_forced(grids[i], winning_configurations, size)),
+            'play_move': over_positions(lambda i: play_move(grids[i], positions[i][1], moves[i])),
+            'game_state_play_undo': over_positions(lambda i: (states[i].play(moves[i], positions[i][1]), states[i].undo(moves[i], positions[i][1]))),
+            'game_state_forced_move': over_positions(lambda i: states[i].forced_move()),
+        }
+        for name, function in timings.items():
+            results[f'{name}/{size}x{size}'] = {'value': best_time(function) / len(grids) * 1e6, 'unit': 'us/call', 'higher_is_better': False}
+
+        tree = MCTSTree(n_cells=size * size)
+        root_moves = list(range(size * size))
+        def expand():
+            tree.add_root((0, 0), 0)
+            tree.add_children(0, root_moves)
+        results[f'tree_add_children/{size}x{size}'] = {'value': best_time(expand) * 1e6, 'unit': 'us/call', 'higher_is_better': False}
+
+
+def bench_esbot(results, sizes):
+    for size in sizes:
+        winning_configurations = create_win_grids(size)
+        bots = []
+        # in memory recursive solve (strategy_dir=None), larger boards take minutes to solve, they are built only once
+        build = lambda: bots.append(ESBot(size, winning_configurations, strategy_dir=None))
+        seconds = best_time(build, repeat=3 if size <= 3 else 1, number=1)
+        results[f'esbot_build/{size}x{size}'] = {'value': seconds, 'unit': 's', 'higher_is_better': False}
+        results[f'esbot_entries/{size}x{size}'] = {'value': sum(len(level) for level in bots[-1].strategy.values()), 'unit': 'entries', 'higher_is_better': False}
+
+        # default construction: the retrograde solve of a missing table, then the memory mapped load of the stored one
+        with tempfile.TemporaryDirectory() as strategy_dir:
+            path = strategy_path(strategy_dir, size, winning_configurations)
+            seconds = best_time(lambda: solve_to_file(size, winning_configurations, path), repeat=3 if size <= 3 else 1, number=1)
+            results[f'esbot_retrograde_solve/{size}x{size}'] = {'value': seconds, 'unit': 's', 'higher_is_better': False}
+            load = lambda: bots.append(ESBot(size, winning_configurations, strategy_dir=strategy_dir))
+            results[f'esbot_table_load/{size}x{size}'] = {'value': best_time(load) * 1e3, 'unit': 'ms', 'higher_is_better': False}
+            results[f'esbot_table_entries/{size}x{size}'] = {'value': len(bots[-1].strategy), 'unit': 'entries', 'higher_is_better': False}
+            bots.clear() # the memory maps are closed before the folder is removed
+
+
+def bench_mcts(results, sizes, iterations):
+    for size in sizes:
+        winning_configurations = create_win_grids(size)
+        moves = empty_cells((0, 0), size)
+
+        bot = MCTSBot(size, winning_configurations, 0, reuse_tree=False, seed=0)
+        seconds = best_time(lambda: bot.next_move((0, 0), moves, node_budget=iterations), repeat=3, number=1)
+        # the solver may stop the search before the budget is used
+        results[f'mcts_iterations/{size}x{size}'] = {'value': bot.iterations_done / seconds, 'unit': 'it/s', 'higher_is_better': True}
+
+        n_rollouts = 500
+        seconds = best_time(lambda: [bot._simulate((0, 0), moves, 0) for _ in range(n_rollouts)], repeat=5, number=1)
+        results[f'rollouts/{size}x{size}'] = {'value': n_rollouts / seconds, 'unit': 'rollouts/s', 'higher_is_better': True}
+
+        rng = np.random.default_rng(0)
+        n_rollouts = 5000
+        seconds = best_time(lambda: batch_rollouts((0, 0), 0, n_rollouts, winning_configurations, size, rng), repeat=5, number=1)
+        results[f'batch_rollouts/{size}x{size}'] = {'value': n_rollouts / seconds, 'unit': 'rollouts/s', 'higher_is_better': True}
+
+
+def run(esbot_sizes=(3,), mcts_iterations=2000):
+    results = {}
+    bench_primitives(results, [3, 4, 5])
+    bench_esbot(results, esbot_sizes)
+    bench_mcts(results, [3, 4, 5], mcts_iterations)
+    return results
+
+
+def best_of(runs):
+    """Best value of each benchmark over several runs of the suite, less sensitive to a busy machine than a single run."""
+    results = {}
+    for run_results in runs:
+        for name, result in run_results.items():
+            best = results.get(name)
+            if best is None or (result['value'] > best['value'] if result['higher_is_better'] else result['value'] < best['value']):
+                results[name] = result
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints current against baseline values, returns the names of the benchmarks that got worse by more than threshold."""
+    regressions = []
+    print(f'{"benchmark":32} {"baseline":>12} {"current":>12} {"change":>8}')
+    for name, current in results.items():
+        if name not in baseline:
+            print(f'{name:32} {"-":>12} {current["value"]:12.4g} {"new":>8}')
+            continue
+        old = baseline[name]['value']
+        change = (current['value'] - old) / old if old else 0.0
+        worse = -change if current['higher_is_better'] else change
+        flag = ''
+        if worse > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:32} {old:12.4g} {current["value"]:12.4g} {change:+8.1%}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the engine hot paths.')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON baseline to compare the results with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression (default 0.2)')
+    parser.add_argument('--esbot-sizes', type=int, nargs='*', default=[3], help='board sizes for the ESBot construction benchmark')
+    parser.add_argument('--mcts-iterations', type=int, default=2000, help='iterations of each MCTS search')
+    parser.add_argument('--runs', type=int, default=1, help='runs of the whole suite, the best value of each benchmark is kept')
+    args = parser.parse_args(argv)
+
+    results = best_of([run(args.esbot_sizes, args.mcts_iterations) for _ in range(args.runs)])
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['benchmarks']
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        for name, result in results.items():
+            print(f'{name:32} {result["value"]:12.4g} {result["unit"]}')
+        regressions = []
+
+    if args.save:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                'date': time.strftime('%Y-%m-%d')}
+        with open(args.save, 'w') as f:
+            json.dump({'meta': meta, 'benchmarks': results}, f, indent=2)
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
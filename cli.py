@@ -0,0 +1,77 @@
+import argparse
+
+# Entry point of the engine: python -m cli play | tournament | bench.
+# Only argparse is imported upfront, each command imports what it needs when it runs,
+# so that short lived processes do not pay for NumPy or the bots they do not use.
+
+BOT_NAMES = ['ESBot', 'MCTSBot', 'AlphaBetaBot']
+
+
+def play(args):
+    """Interactive game, a player that is not a bot name is a human."""
+    from tictactoe_class import TicTacToe
+
+    game = TicTacToe(args.size, args.k, headless=args.quiet)
+    game.PlayGame(args.x, args.o)
+    if args.quiet:
+        # only the result is printed in quiet mode
+        result = game.game_winner() if game.winner else 0
+        print({0: 'draw', 1: f'{args.x} wins', 2: f'{args.o} wins'}[result])
+
+
+def tournament(args):
+    from tictactoe_class import load_bot_class
+    from tournament import tournament as run
+    from game_records import GameRecorder
+
+    bots = load_bot_class(args.first), load_bot_class(args.second)
+    if args.record is None:
+        run(args.size, *bots, args.games, args.workers, args.seed, verbose=True, win_length=args.k)
+    else:
+        with GameRecorder(args.record) as recorder:
+            run(args.size, *bots, args.games, args.workers, args.seed, verbose=True, recorder=recorder, win_length=args.k)
+
+
+def bench(args):
+    import benchmarks
+
+    benchmarks.main(args.bench_args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cli', description='Plays, benchmarks and runs tournaments between the tic-tac-toe bots.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_play = commands.add_parser('play', help='play a game, against a bot or between two bots')
+    parser_play.add_argument('--size', type=int, default=3)
+    parser_play.add_argument('--k', type=int, default=None, help='marks in a row needed to win (default: size)')
+    parser_play.add_argument('--x', default='Player', help=f'first player: {", ".join(BOT_NAMES)} or the name of a human')
+    parser_play.add_argument('--o', default='ESBot', help='second player, same choices as --x')
+    parser_play.add_argument('--quiet', action='store_true', help='headless game, only prints the result (bots only)')
+    parser_play.set_defaults(run=play)
+
+    parser_tournament = commands.add_parser('tournament', help='many games between two bots over a process pool')
+    parser_tournament.add_argument('first', choices=BOT_NAMES)
+    parser_tournament.add_argument('second', choices=BOT_NAMES)
+    parser_tournament.add_argument('--size', type=int, default=3)
+    parser_tournament.add_argument('--k', type=int, default=None, help='marks in a row needed to win (default: size)')
+    parser_tournament.add_argument('--games', type=int, default=100)
+    parser_tournament.add_argument('--workers', type=int, default=None, help='processes playing the games (default: number of CPUs)')
+    parser_tournament.add_argument('--seed', type=int, default=0)
+    parser_tournament.add_argument('--record', help='append the record of every game to this NDJSON log (.gz to compress it)')
+    parser_tournament.set_defaults(run=tournament)
+
+    parser_bench = commands.add_parser('bench', help='benchmarks of the engine hot paths, the arguments are passed to benchmarks.py', add_help=False)
+    parser_bench.set_defaults(run=bench)
+
+    args, bench_args = parser.parse_known_args(argv)
+    if args.command != 'bench' and bench_args:
+        parser.error(f'unrecognized arguments: {" ".join(bench_args)}')
+    args.bench_args = bench_args
+    if args.command == 'play' and args.quiet and not (args.x in BOT_NAMES and args.o in BOT_NAMES):
+        parser.error('--quiet games need two bots')
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,33 @@
+import os
+
 WIN_SCORE = 1
 LOSE_SCORE = -1
 TIE_SCORE = 0
 
-N_ITERATIONS_PER_MOVE = 100
\ No newline at end of file
+N_ITERATIONS_PER_MOVE = 100
+N_ROLLOUTS_PER_LEAF = 1 # games simulated at once from each selected leaf, more than 1 uses batch_rollouts
+N_MCTS_WORKERS = 1 # processes searching each move in parallel from the root
+MCTS_WIDENING_C = None # progressive widening: a node visited N times has at most max(1, C * N ** ALPHA) children, None to disable
+MCTS_WIDENING_ALPHA = 0.5
+MCTS_SOLVER = True # MCTS-Solver: proven wins, losses and draws are propagated in the tree and end the search once the root is proven
+MCTS_RAVE_K = None # RAVE: the AMAF value of a child visited N times weighs sqrt(K / (3 N + K)) in its selection, None to disable (30 works well on 3x3)
+MCTS_RAVE_EXPLORATION = 1 # weight of the UCB exploration term when RAVE is enabled
+OPENING_BOOK_PLIES = 2 # plies covered by the MCTS opening book
+OPENING_BOOK_ITERATIONS = 50000 # iterations of the offline search of each book position
+
+ESBOT_CACHE_SIZE = 1000000 # positions remembered by ESBot in lazy mode, the least recently used are forgotten first
+ESBOT_MAX_TABLE_ENTRIES = 20000000 # positions ESBot solves upfront before giving up, larger boards need lazy mode (4x4 has 1.2M)
+
+AB_TIME_BUDGET_MS = 1000 # time the alpha-beta bot is allowed to think for each move
+
+SERVER_PORT = 8765 # port of game_server.py
+SERVER_MAX_QUEUE = 1000 # bot moves waiting for a worker before the server starts refusing new ones
+SERVER_LATENCY_WINDOW = 10000 # number of recent move latencies the percentiles are computed on
+SERVER_ESBOT_MAX_SIZE = 4 # largest board ESBot is offered on, larger tables cannot be solved in a worker
+
+GAME_RECORD_BUFFER = 1000 # game records serialized in memory before being appended to the log in one write
+
+SHIFT_WIN_CHECK_MIN_LINES = 32 # boards with more winning lines than this check wins with bit shifts instead of scanning the lines
+
+# folder where the solved ESBot strategies and the opening books are stored
+STRATEGY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'strategies')
\ No newline at end of file
@@ -1,63 +1,184 @@
 from utils import *
+from game_state import LineIndex, GameState
 import os
+from collections import OrderedDict
+
+import config
 
 class ESBot:
 
-    def __init__(self, size, winning_configurations):
+    def __init__(self, size, winning_configurations, strategy_dir=config.STRATEGY_DIR, lazy=False, cache_size=config.ESBOT_CACHE_SIZE):
+        """
+        The optimal strategy is loaded from strategy_dir when it has already been solved for this
+        board size and set of winning configurations, otherwise it is computed and saved there.
+        With strategy_dir = None the strategy is always computed and kept in memory, with no limit on its size.
+        Stored tables key the grids with 64 bit integers: larger boards (6x6 and up) raise ValueError, and solving a
+        table with more than config.ESBOT_MAX_TABLE_ENTRIES positions raises MemoryError (5x5). Such boards need
+        the lazy mode.
+        With lazy = True nothing is solved upfront: each move is solved exactly from the position it is
+        asked for, and the solved positions are kept in an LRU cache of at most cache_size entries
+        that lasts across moves and games.
+        """
         self.name = 'ESBot'
-        self.strategy = self.compute_optimal_strategy((0,0), 0,  winning_configurations, seen_by_moves = None, size = size)
+        self.size = size
+        self.winning_configurations = winning_configurations
+        self.lazy = lazy
+
+        # positions are stored once per symmetry class: rotations and reflections of a grid share the same entry
+        self.symmetries = create_symmetries(size)
+        self.inverse_symmetries = [invert_symmetry(symmetry) for symmetry in self.symmetries]
+        self.symmetry_tables = create_symmetry_tables(self.symmetries)
+
         self.current_grid = None
+        if lazy:
+            self.strategy = None
+            self.line_index = LineIndex(size, winning_configurations)
+            self.cache = OrderedDict() # canonical grid -> (move in the canonical orientation, score), oldest first
+            self.cache_size = cache_size
+            self.cache_hits = 0
+            self.cache_misses = 0
+            self.cache_evictions = 0
+        else:
+            self.strategy = self._load_strategy(size, winning_configurations, strategy_dir)
+
+    def _load_strategy(self, size, winning_configurations, strategy_dir):
+
+        if strategy_dir is None:
+            return self.compute_optimal_strategy((0,0), 0,  winning_configurations, seen_by_moves = None, size = size)
+
+        # the table code needs NumPy, it is imported here so that a lazy ESBot does not load it
+        from strategy_table import StrategyTable, strategy_path
+        from retrograde_solver import solve_to_file
+
+        if 2 * size * size > 62:
+            raise ValueError(f'Grids of size {size} do not fit in the 64 bit keys of a strategy table, use lazy=True or strategy_dir=None')
+
+        path = strategy_path(strategy_dir, size, winning_configurations)
+        if not os.path.exists(path):
+            solve_to_file(size, winning_configurations, path, max_entries=config.ESBOT_MAX_TABLE_ENTRIES)
 
+        table = StrategyTable(path)
+        if not table.matches(size, winning_configurations):
+            raise ValueError(f'The strategy stored in {path} was solved for a different board')
+        return table
 
-    def compute_optimal_strategy(self, grid, player, winning_configurations, seen_by_moves, size = 3):
+
+    def compute_optimal_strategy(self, grid, player, winning_configurations, seen_by_moves, size = 3, state = None):
+        """
+        Fills seen_by_moves with the optimal (move, score) of every reachable position.
+        Positions are keyed by their canonical grid and the stored move is expressed
+        in the canonical orientation.
+        state is the GameState of grid, moves are played and undone on it along the recursion.
+        """
         
         if seen_by_moves is None:
             seen_by_moves = {i: dict() for i in range(size * size + 1)}
+        if state is None:
+            state = GameState(LineIndex(size, winning_configurations), grid)
             
         conf1, conf2 = grid   
-        n_moves = bin(conf1 | conf2).count('1')
+        n_moves = popcount(conf1 | conf2)
+        canonical, symmetry = canonical_grid(grid, self.symmetry_tables)
         
-        if grid in seen_by_moves[n_moves]:
+        if canonical in seen_by_moves[n_moves]:
             return seen_by_moves
         
-        seen_by_moves[n_moves][grid] = (None, None)
+        seen_by_moves[n_moves][canonical] = (None, None)
         
-        if is_win(grid, winning_configurations):
-            seen_by_moves[n_moves][grid] = (None, -1)
+        if state.winner:
+            seen_by_moves[n_moves][canonical] = (None, -1)
             return seen_by_moves
         
-        if is_full(grid, size):
-            seen_by_moves[n_moves][grid] = (None, 0)
+        if state.is_full():
+            seen_by_moves[n_moves][canonical] = (None, 0)
             return seen_by_moves
         
+        # lost positions keep a move too, the first one, so that the bot can always play
         current_best_score = -1
         current_best_move = None
-        for move in range(size ** 2):
-            if (conf1 | conf2) & (1 << move) != 0:
-                continue
+        for move in iter_moves(empty_cells(grid, size)):
             new_grid = play_move(grid, player, move)
             
             if new_grid is None:
                 continue
-            seen_by_moves = self.compute_optimal_strategy(new_grid, 1 - player , winning_configurations, seen_by_moves, size)
+            new_canonical, _ = canonical_grid(new_grid, self.symmetry_tables)
+            if new_canonical not in seen_by_moves[n_moves + 1]:
+                state.play(move, player)
+                seen_by_moves = self.compute_optimal_strategy(new_grid, 1 - player , winning_configurations, seen_by_moves, size, state)
+                state.undo(move, player)
             
-            move_score = - seen_by_moves[n_moves + 1][new_grid][1]
-            if move_score > current_best_score:
+            move_score = - seen_by_moves[n_moves + 1][new_canonical][1]
+            if current_best_move is None or move_score > current_best_score:
                 current_best_score = move_score
                 current_best_move = move
-        seen_by_moves[n_moves][grid] = (current_best_move, current_best_score)
+        current_best_move = self.symmetries[symmetry][current_best_move]
+        seen_by_moves[n_moves][canonical] = (current_best_move, current_best_score)
 
         return seen_by_moves
         
 
-    def next_move(self, current_state):
+    def next_move(self, current_state, valid_moves=None):
         """
         This method should return the next move of the bot using the precomputed tree.
-        The current_state parameter is the current state of the game.
+        The current_state parameter is the current state of the game. valid_moves is not needed,
+        it is accepted so that every bot can be called the same way.
         """
         self.current_grid = tuple(current_state)
+        canonical, symmetry = canonical_grid(self.current_grid, self.symmetry_tables)
+
+        if self.lazy:
+            conf0, conf1 = self.current_grid
+            player = 0 if popcount(conf0) == popcount(conf1) else 1
+            move = self._solve(self.current_grid, player, GameState(self.line_index, self.current_grid))[0]
+        else:
+            move = self.strategy[popcount(self.current_grid[0] | self.current_grid[1])][canonical][0]
+        if move is None:
+            return None
+        # the stored move refers to the canonical grid, send it back to the orientation of the current grid
+        return self.inverse_symmetries[symmetry][move]
+
+    def _solve(self, grid, player, state):
+        """
+        Negamax of the lazy mode, returns the (move, score) of grid as compute_optimal_strategy stores them,
+        the move being in the canonical orientation. state is the GameState of grid.
+        """
+        canonical, symmetry = canonical_grid(grid, self.symmetry_tables)
+        entry = self.cache.get(canonical)
+        if entry is not None:
+            self.cache_hits += 1
+            self.cache.move_to_end(canonical)
+            return entry
+        self.cache_misses += 1
+
+        if state.winner:
+            entry = (None, -1)
+        elif state.is_full():
+            entry = (None, 0)
+        else:
+            # lost positions keep their first move, as in compute_optimal_strategy
+            best_move, best_score = None, -1
+            for move in iter_moves(empty_cells(grid, self.size)):
+                state.play(move, player)
+                move_score = - self._solve(play_move(grid, player, move), 1 - player, state)[1]
+                state.undo(move, player)
+                if best_move is None or move_score > best_score:
+                    best_move, best_score = move, move_score
+                    # nothing beats a win, the other moves would not change the stored move
+                    if best_score == 1:
+                        break
+            best_move = self.symmetries[symmetry][best_move]
+            entry = (best_move, best_score)
+
+        self.cache[canonical] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.cache_evictions += 1
+        return entry
 
-        return self.strategy[bin(self.current_grid[0] | self.current_grid[1]).count('1')][self.current_grid][0]
+    def cache_info(self):
+        """Statistics of the cache of the lazy mode."""
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'evictions': self.cache_evictions,
+                'size': len(self.cache), 'max_size': self.cache_size}
 
     def __str__(self):
         return self.name
@@ -0,0 +1,97 @@
+import json
+
+import config
+
+# Game logs are NDJSON: one JSON object per line and per game, appended as games finish.
+#   {"size": 3, "k": 3, "players": ["MCTSBot", "ESBot"], "moves": [4, 0, ...], "think_ms": [12.1, 0.02, ...],
+#    "result": 0, "stats": [{"iterations": 900, ...}, null, ...]}
+# result follows TicTacToe.automatic_games: 0 draw, 1 first player won, 2 second player won.
+# stats holds the SearchStats summary of each move for the bots that collect them, null for the others.
+# Paths ending in .gz are read and written compressed.
+
+STATS_FIELDS = ['iterations', 'time_ms', 'max_depth', 'root_forced', 'book_move', 'root_proven']
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        import gzip
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def move_stats(bot):
+    """Summary of the SearchStats of the last move of bot, None if it does not collect them."""
+    stats = getattr(bot, 'last_stats', None)
+    if stats is None:
+        return None
+    return {field: getattr(stats, field) for field in STATS_FIELDS}
+
+
+def game_record(size, k, players, moves, think_ms, result, stats=None):
+    record = {'size': size, 'k': k, 'players': [str(player) for player in players], 'moves': [int(move) for move in moves],
+              'think_ms': [round(ms, 3) for ms in think_ms], 'result': result}
+    if stats is not None and any(move is not None for move in stats):
+        record['stats'] = stats
+    return record
+
+
+class GameRecorder:
+    """
+    Appends game records to an NDJSON log. Records are serialized as they come but written in chunks of
+    buffer_size lines, so that recording many short games costs one write per chunk. Use it as a context
+    manager, or call close, so that the last chunk is written.
+    """
+
+    def __init__(self, path, buffer_size=config.GAME_RECORD_BUFFER):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.n_records = 0
+        self.file = _open(path, 'a')
+
+    def add(self, record):
+        self.buffer.append(json.dumps(record, separators=(',', ':')))
+        self.n_records += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryRecorder:
+    """Keeps the records in a list, used by the tournament workers that send their records back to the main process."""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record)
+
+
+def read_games(path):
+    """
+    Yields the records of a game log one at a time, so that logs of any size can be scanned.
+    A last line cut short by an interrupted run is skipped.
+    """
+    with _open(path, 'r') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils import create_win_grids, is_win, is_full, empty_cells
+from esbot_class import ESBot
+from MCSTBot_class import MCTSBot
+from alphabetabot_class import AlphaBetaBot
+from tournament import make_bot
+
+import config
+
+# Protocol: one JSON object per line in both directions, every reply echoes the "id" of its request if given.
+#   {"op": "new", "size": 3, "k": 3, "bot": "MCTSBot", "bot_player": 1}  starts a game against a bot
+#   {"op": "move", "game": 7, "position": 4}                              plays a move, the reply holds the bot answer
+#   {"op": "state", "game": 7}, {"op": "close", "game": 7}
+#   {"op": "stats"}                                                       games, queue and move latency percentiles
+# Replies carry the game as {"game", "grid": [conf0, conf1], "n_moves", "winner", "bot_move"}, winner being
+# null while the game is running, 0 for a draw and 1 or 2 as in TicTacToe.automatic_games.
+# Errors are replied as {"error": message}.
+# A game belongs to the connection that started it: other connections cannot see it, and it is dropped when
+# its connection closes. ESBot solves its whole table, it is only offered up to config.SERVER_ESBOT_MAX_SIZE.
+
+BOTS = {'ESBot': ESBot, 'MCTSBot': MCTSBot, 'AlphaBetaBot': AlphaBetaBot}
+
+
+_worker_bots = {} # bots kept by each worker process of the pool, one per bot, board and player
+
+def _bot_move(bot_name, size, k, player, grid):
+    """Runs in a worker of the pool: the move of the bot in grid."""
+
+    key = (bot_name, size, k, player)
+    if key not in _worker_bots:
+        kwargs = {'reuse_tree': False} if bot_name == 'MCTSBot' else {}
+        _worker_bots[key] = make_bot(BOTS[bot_name], size, create_win_grids(size, k), player, kwargs)
+    bot = _worker_bots[key]
+
+    return bot.next_move(grid, empty_cells(grid, size))
+
+
+def latency_summary(latencies):
+    """Count, mean, p50 and p99 of a sequence of latencies in seconds, reported in milliseconds."""
+    if len(latencies) == 0:
+        return {'count': 0, 'mean_ms': None, 'p50_ms': None, 'p99_ms': None}
+    latencies = np.array(latencies) * 1000
+    return {'count': len(latencies), 'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)), 'p99_ms': float(np.percentile(latencies, 99))}
+
+
+class GameError(Exception):
+    pass
+
+
+class GameSession:
+    """One game between a remote player and a bot, bot_player being the player (0 or 1) the bot plays as."""
+
+    def __init__(self, game_id, size, k, winning_configurations, bot_name, bot_player):
+        self.game_id = game_id
+        self.size = size
+        self.k = k
+        self.winning_configurations = winning_configurations
+        self.bot_name = bot_name
+        self.bot_player = bot_player
+        self.grid = (0, 0)
+        self.n_moves = 0
+        self.winner = None
+        self.bot_thinking = False
+
+    @property
+    def player(self):
+        return self.n_moves % 2
+
+    def play(self, position):
+        if self.winner is not None:
+            raise GameError('the game is over')
+        if not isinstance(position, int) or not 0 <= position < self.size * self.size:
+            raise GameError(f'position must be an integer between 0 and {self.size * self.size - 1}')
+        if (self.grid[0] | self.grid[1]) & (1 << position):
+            raise GameError(f'position {position} is already taken')
+
+        if self.player == 0:
+            self.grid = (self.grid[0] | (1 << position), self.grid[1])
+        else:
+            self.grid = (self.grid[0], self.grid[1] | (1 << position))
+        self.n_moves += 1
+
+        winner = is_win(self.grid, self.winning_configurations)
+        if winner:
+            self.winner = winner
+        elif is_full(self.grid, self.size):
+            self.winner = 0
+
+    def to_dict(self, bot_move=None):
+        return {'game': self.game_id, 'grid': list(self.grid), 'n_moves': self.n_moves, 'winner': self.winner, 'bot_move': bot_move}
+
+
+class GameServer:
+    """
+    asyncio server holding many concurrent game sessions. The games themselves are cheap and live in the
+    event loop, the bot moves run in a shared process pool. At most n_workers bot moves are sent to the pool
+    at once, the others wait in the server, and new ones are refused once max_queue of them are waiting.
+    """
+
+    def __init__(self, host='127.0.0.1', port=config.SERVER_PORT, n_workers=None, max_queue=config.SERVER_MAX_QUEUE):
+        self.host = host
+        self.port = port
+        self.n_workers = n_workers or os.cpu_count()
+        self.max_queue = max_queue
+
+        self.sessions = {}
+        self.game_ids = itertools.count(1)
+        self.winning_configurations = {} # (size, k) -> winning configurations
+
+        self.executor = None
+        self.worker_slots = None
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self.games_started = 0
+        self.latencies = deque(maxlen=config.SERVER_LATENCY_WINDOW)
+        self.server = None
+        self.connections = {} # writer -> task handling the connection
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.n_workers)
+        self.worker_slots = asyncio.Semaphore(self.n_workers)
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, limit=2 ** 16)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # the connections still open are closed too, their handlers then see the end of the stream and return
+            handlers = list(self.connections.values())
+            for writer in list(self.connections):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f'SERVING ON {self.host}:{self.port} WITH {self.n_workers} WORKERS')
+        async with self.server:
+            await self.server.serve_forever()
+
+    def stats(self):
+        return {'games_active': len(self.sessions), 'games_started': self.games_started, 'moves_waiting': self.waiting,
+                'moves_running': self.running, 'moves_rejected': self.rejected, 'move_latency': latency_summary(self.latencies)}
+
+    async def _handle_client(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        games = set() # ids of the games started by this connection
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = {}
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        request = {}
+                        raise GameError('requests must be JSON objects')
+                    reply = await self._dispatch(request, games)
+                except (GameError, ValueError, KeyError, TypeError) as error:
+                    reply = {'error': str(error)}
+                if 'id' in request:
+                    reply['id'] = request['id']
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            for game_id in games:
+                self.sessions.pop(game_id, None)
+            writer.close()
+
+    async def _dispatch(self, request, games):
+        op = request.get('op')
+        if op == 'new':
+            return await self._new_game(request, games)
+        if op == 'move':
+            return await self._move(request, games)
+        if op == 'state':
+            return self._session(request, games).to_dict()
+        if op == 'close':
+            game_id = self._session(request, games).game_id
+            self.sessions.pop(game_id)
+            games.discard(game_id)
+            return {'game': request['game'], 'closed': True}
+        if op == 'stats':
+            return self.stats()
+        raise GameError(f'unknown op {op!r}')
+
+    def _session(self, request, games):
+        session = self.sessions.get(request.get('game')) if request.get('game') in games else None
+        if session is None:
+            raise GameError(f'no game {request.get("game")}')
+        return session
+
+    async def _new_game(self, request, games):
+        size = int(request.get('size', 3))
+        k = int(request.get('k', size))
+        bot_name = request.get('bot', 'MCTSBot')
+        bot_player = int(request.get('bot_player', 1))
+        if bot_name not in BOTS:
+            raise GameError(f'bot must be one of {", ".join(BOTS)}')
+        if not 2 <= size <= 7 or not 1 <= k <= size or bot_player not in (0, 1):
+            raise GameError('invalid size, k or bot_player')
+        if bot_name == 'ESBot' and size > config.SERVER_ESBOT_MAX_SIZE:
+            raise GameError(f'ESBot plays on boards of size at most {config.SERVER_ESBOT_MAX_SIZE}')
+
+        if bot_player == 0:
+            self._admit()
+
+        if (size, k) not in self.winning_configurations:
+            self.winning_configurations[(size, k)] = create_win_grids(size, k)
+        session = GameSession(next(self.game_ids), size, k, self.winning_configurations[(size, k)], bot_name, bot_player)
+        self.sessions[session.game_id] = session
+        games.add(session.game_id)
+        self.games_started += 1
+
+        bot_move = await self._play_bot(session) if bot_player == 0 else None
+        return session.to_dict(bot_move)
+
+    async def _move(self, request, games):
+        session = self._session(request, games)
+        if session.bot_thinking or session.player == session.bot_player:
+            raise GameError('not your turn')
+        self._admit()
+        session.play(request.get('position'))
+        bot_move = await self._play_bot(session) if session.winner is None else None
+        return session.to_dict(bot_move)
+
+    def _admit(self):
+        # checked before the move of the player is played, so that a refused request leaves the game unchanged
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise GameError('server busy, try again later')
+
+    async def _play_bot(self, session):
+        """Computes the bot move in the pool and plays it, the latency is measured from the admission of the request."""
+
+        start = time.perf_counter()
+        session.bot_thinking = True
+        try:
+            self.waiting += 1
+            try:
+                await self.worker_slots.acquire()
+            finally:
+                self.waiting -= 1
+
+            self.running += 1
+            try:
+                loop = asyncio.get_running_loop()
+                move = await loop.run_in_executor(self.executor, _bot_move, session.bot_name, session.size, session.k,
+                                                  session.bot_player, session.grid)
+            finally:
+                self.running -= 1
+                self.worker_slots.release()
+        finally:
+            session.bot_thinking = False
+
+        session.play(int(move))
+        self.latencies.append(time.perf_counter() - start)
+        return int(move)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves games against the bots as JSON lines over TCP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=None, help='processes computing the bot moves (default: number of CPUs)')
+    parser.add_argument('--max-queue', type=int, default=config.SERVER_MAX_QUEUE, help='bot moves allowed to wait for a worker')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(GameServer(args.host, args.port, args.workers, args.max_queue).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+from utils import popcount
+
+
+class LineIndex:
+    """
+    Precomputed lookup from each cell to the winning lines that go through it,
+    shared by all the GameState objects of the same board.
+    """
+
+    def __init__(self, size, winning_configurations):
+        self.size = size
+        self.masks = list(winning_configurations)
+        self.lengths = [popcount(mask) for mask in self.masks]
+        self.cell_lines = [[line for line, mask in enumerate(self.masks) if mask & (1 << cell)] for cell in range(size * size)]
+
+
+class GameState:
+    """
+    Grid together with the number of marks of each player on every winning line.
+    Playing or undoing a move only updates the lines through that cell, so checking
+    whether the move won and looking for a forced move do not scan all the lines.
+    """
+
+    def __init__(self, index, grid=(0, 0)):
+        self.index = index
+        self.grid = [0, 0]
+        self.counts = [[0] * len(index.masks), [0] * len(index.masks)]
+        self.threats = set() # lines where a player needs one more mark and the opponent has none
+        self.winner = 0      # 0 if nobody has won, 1 or 2 as in utils.is_win
+        self.n_moves = 0
+
+        for player in [0, 1]:
+            conf = grid[player]
+            while conf:
+                move = (conf & -conf).bit_length() - 1
+                self.play(move, player)
+                conf &= conf - 1
+
+    def copy(self):
+        state = GameState.__new__(GameState)
+        state.index = self.index
+        state.grid = self.grid.copy()
+        state.counts = [self.counts[0].copy(), self.counts[1].copy()]
+        state.threats = self.threats.copy()
+        state.winner = self.winner
+        state.n_moves = self.n_moves
+        return state
+
+    def play(self, move, player):
+        """Places a mark of player on move, returns True if it completes a line."""
+
+        self.grid[player] |= 1 << move
+        self.n_moves += 1
+        counts = self.counts[player]
+        won = False
+        for line in self.index.cell_lines[move]:
+            counts[line] += 1
+            self._update_threat(line)
+            if counts[line] == self.index.lengths[line]:
+                won = True
+        if won:
+            self.winner = player + 1
+        return won
+
+    def undo(self, move, player):
+        """Removes the mark of player from move. Games stop at the first win, so the grid has no winner afterwards."""
+
+        self.grid[player] &= ~(1 << move)
+        self.n_moves -= 1
+        counts = self.counts[player]
+        for line in self.index.cell_lines[move]:
+            counts[line] -= 1
+            self._update_threat(line)
+        self.winner = 0
+
+    def _update_threat(self, line):
+        count0, count1 = self.counts[0][line], self.counts[1][line]
+        missing_one = self.index.lengths[line] - 1
+        if (count0 == missing_one and count1 == 0) or (count1 == missing_one and count0 == 0):
+            self.threats.add(line)
+        else:
+            self.threats.discard(line)
+
+    def forced_move(self):
+        """Same move as utils.is_move_forced: the empty cell of the first line that one of the players can complete."""
+
+        if not self.threats:
+            return None
+        line = min(self.threats)
+        return (self.index.masks[line] & ~(self.grid[0] | self.grid[1])).bit_length() - 1
+
+    def winning_move(self, player):
+        """Empty cell that completes a line of player, or None."""
+
+        counts = self.counts[player]
+        for line in sorted(self.threats):
+            if counts[line] == self.index.lengths[line] - 1:
+                return (self.index.masks[line] & ~(self.grid[0] | self.grid[1])).bit_length() - 1
+        return None
+
+    def is_full(self):
+        return self.n_moves == self.index.size * self.index.size
+
+    def is_over(self):
+        return self.winner != 0 or self.is_full()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from utils import empty_cells, random_move
+from game_server import GameServer, latency_summary
+
+import config
+
+
+async def _request(reader, writer, request):
+    writer.write(json.dumps(request).encode() + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def play_games(host, port, n_games, size, bot, rng, latencies, errors, finished):
+    """One client connection playing n_games random games in a row against the bot, alternating who starts."""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(n_games):
+            start = time.perf_counter()
+            game = await _request(reader, writer, {'op': 'new', 'size': size, 'bot': bot, 'bot_player': i % 2})
+            if 'error' in game:
+                errors.append(game['error'])
+                continue
+            game_id = game['game']
+            if game['bot_move'] is not None:
+                latencies.append(time.perf_counter() - start)
+
+            while game['winner'] is None:
+                position = random_move(empty_cells(game['grid'], size), rng)
+                start = time.perf_counter()
+                game = await _request(reader, writer, {'op': 'move', 'game': game_id, 'position': position})
+                if 'error' in game:
+                    errors.append(game['error'])
+                    break
+                if game['bot_move'] is not None:
+                    latencies.append(time.perf_counter() - start)
+            else:
+                finished.append(game['winner'])
+
+            await _request(reader, writer, {'op': 'close', 'game': game_id})
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_load(host, port, n_clients, games_per_client, size=3, bot='MCTSBot', seed=0):
+    """
+    Opens n_clients concurrent connections each playing games_per_client games with random moves,
+    returns the throughput, the move latencies seen by the clients and the statistics of the server.
+    Games refused by a busy server count as errors and not as finished games.
+    """
+
+    latencies, errors, finished = [], [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[play_games(host, port, games_per_client, size, bot, random.Random(seed + i), latencies, errors, finished)
+                           for i in range(n_clients)])
+    seconds = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    server_stats = await _request(reader, writer, {'op': 'stats'})
+    writer.close()
+    await writer.wait_closed()
+
+    return {'seconds': seconds, 'games_finished': len(finished), 'games_per_s': len(finished) / seconds, 'moves_per_s': len(latencies) / seconds,
+            'errors': len(errors), 'client_latency': latency_summary(latencies), 'server': server_stats}
+
+
+async def _run_local(args):
+    server = await GameServer(args.host, 0, args.workers, args.max_queue).start()
+    try:
+        return await run_load(args.host, server.port, args.clients, args.games, args.size, args.bot, args.seed)
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for game_server.py: many clients playing random games at once.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument('--clients', type=int, default=100, help='concurrent connections')
+    parser.add_argument('--games', type=int, default=5, help='games played by each connection')
+    parser.add_argument('--size', type=int, default=3)
+    parser.add_argument('--bot', default='MCTSBot')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--local', action='store_true', help='start a server in this process instead of connecting to --port')
+    parser.add_argument('--workers', type=int, default=None, help='workers of the --local server')
+    parser.add_argument('--max-queue', type=int, default=config.SERVER_MAX_QUEUE, help='queue limit of the --local server')
+    args = parser.parse_args()
+
+    if args.local:
+        summary = asyncio.run(_run_local(args))
+    else:
+        summary = asyncio.run(run_load(args.host, args.port, args.clients, args.games, args.size, args.bot, args.seed))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
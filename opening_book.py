@@ -0,0 +1,126 @@
+import argparse
+import os
+import time
+
+from utils import *
+from strategy_table import StrategyTable, strategy_path
+from MCSTBot_class import MCTSBot
+
+import config
+
+
+def book_path(directory, size, winning_configurations):
+    return strategy_path(directory, size, winning_configurations, prefix='book')
+
+
+def opening_positions(size, winning_configurations, n_plies, symmetry_tables):
+    """
+    Canonical grids of the positions reachable in less than n_plies moves that are not over yet,
+    grouped by number of moves played.
+    """
+    positions = {0: [(0, 0)]}
+    for n_moves in range(1, n_plies):
+        seen = set()
+        for grid in positions[n_moves - 1]:
+            for move in iter_moves(empty_cells(grid, size)):
+                new_grid = play_move(grid, (n_moves - 1) % 2, move)
+                if is_win(new_grid, winning_configurations) or is_full(new_grid, size):
+                    continue
+                seen.add(canonical_grid(new_grid, symmetry_tables)[0])
+        positions[n_moves] = sorted(seen)
+    return positions
+
+
+def build_opening_book(size, winning_configurations, n_plies=config.OPENING_BOOK_PLIES, iterations=config.OPENING_BOOK_ITERATIONS,
+                       path=None, n_workers=1, seed=0, verbose=0):
+    """
+    Searches every canonical position of the first n_plies plies with an MCTSBot of the given
+    number of iterations and saves the chosen moves as a StrategyTable, next to the ESBot strategies by default.
+    The stored score is the average value of the chosen move rounded to -1, 0 or 1.
+    """
+    if path is None:
+        path = book_path(config.STRATEGY_DIR, size, winning_configurations)
+
+    symmetry_tables = create_symmetry_tables(create_symmetries(size))
+    positions = opening_positions(size, winning_configurations, n_plies, symmetry_tables)
+
+    book = {}
+    for n_moves, grids in positions.items():
+        book[n_moves] = {}
+        bot = MCTSBot(size, winning_configurations, n_moves % 2, reuse_tree=False, n_workers=n_workers, seed=seed, collect_stats=True)
+        for grid in grids:
+            start = time.perf_counter()
+            move = bot.next_move(grid, empty_cells(grid, size), node_budget=iterations)
+            value = bot.last_stats.child_values.get(move, 0.0)
+            book[n_moves][grid] = (move, int(round(value)))
+            if verbose >= 1:
+                print(f'PLY {n_moves}, GRID {grid}: MOVE {move}, VALUE {value:.3f}, {time.perf_counter() - start:.1f}s')
+        bot.close()
+
+    StrategyTable.save(path, book, size, winning_configurations)
+    return path
+
+
+class OpeningBook:
+    """
+    Moves of the first plies read from a file written by build_opening_book.
+    Positions are looked up by their canonical grid, hits and misses count the lookups of positions
+    inside the plies covered by the book.
+    """
+
+    def __init__(self, path, size, winning_configurations):
+        self.table = StrategyTable(path)
+        if not self.table.matches(size, winning_configurations):
+            raise ValueError(f'The opening book stored in {path} was built for a different board')
+        self.size = size
+        self.n_plies = max([n + 1 for n in range(size * size + 1) if len(self.table[n]) > 0], default=0)
+
+        self.symmetries = create_symmetries(size)
+        self.inverse_symmetries = [invert_symmetry(symmetry) for symmetry in self.symmetries]
+        self.symmetry_tables = create_symmetry_tables(self.symmetries)
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, size, winning_configurations, directory=config.STRATEGY_DIR):
+        """The book of this board in directory, or None if it has not been built."""
+        path = book_path(directory, size, winning_configurations)
+        if not os.path.exists(path):
+            return None
+        return cls(path, size, winning_configurations)
+
+    def lookup(self, grid):
+        """The book move of grid, or None if the position is not in the book."""
+        n_moves = popcount(grid[0] | grid[1])
+        if n_moves >= self.n_plies:
+            return None
+
+        canonical, symmetry = canonical_grid(tuple(grid), self.symmetry_tables)
+        level = self.table[n_moves]
+        if canonical not in level:
+            self.misses += 1
+            return None
+        self.hits += 1
+        move = level[canonical][0]
+        # the stored move refers to the canonical grid, send it back to the orientation of grid
+        return self.inverse_symmetries[symmetry][move]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the MCTS opening book of a board.')
+    parser.add_argument('--size', type=int, default=3)
+    parser.add_argument('--k', type=int, default=None, help='marks in a row needed to win (default: size)')
+    parser.add_argument('--plies', type=int, default=config.OPENING_BOOK_PLIES)
+    parser.add_argument('--iterations', type=int, default=config.OPENING_BOOK_ITERATIONS, help='MCTS iterations per position')
+    parser.add_argument('--workers', type=int, default=1, help='processes of each root parallel search')
+    parser.add_argument('--path', help='output file (default: in config.STRATEGY_DIR)')
+    args = parser.parse_args()
+
+    winning_configurations = create_win_grids(args.size, args.k)
+    path = build_opening_book(args.size, winning_configurations, args.plies, args.iterations, args.path, args.workers, verbose=1)
+    print(f'OPENING BOOK SAVED TO {path}')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,164 @@
+import argparse
+import time
+import numpy as np
+
+from utils import create_win_grids, create_symmetries, create_symmetry_tables, popcount
+from strategy_table import StrategyTable, strategy_path, canonical_keys
+
+import config
+
+
+class RetrogradeSolver:
+    """
+    Solves a board level by level with NumPy arrays instead of recursing from the empty board.
+    Level n holds the sorted keys (conf0 | conf1 << size * size, as in StrategyTable) of the canonical
+    positions with n marks reachable from the root. The levels are first enumerated forward, then
+    solved backward from the last one, looking up the values of all the children of a level at once
+    with searchsorted. Scores and moves follow ESBot.compute_optimal_strategy: the score is for the
+    player that has to move and the move is the first one (in cell order) that reaches the best score,
+    lost positions included.
+    """
+
+    def __init__(self, size, winning_configurations, chunk_size=1 << 20):
+        self.size = size
+        self.n_cells = size * size
+        if 2 * self.n_cells > 62:
+            raise ValueError(f'Grids of size {size} do not fit in a 64 bit key')
+
+        self.winning_configurations = winning_configurations
+        self.masks = np.array(winning_configurations, dtype=np.int64)
+        self.full = (1 << self.n_cells) - 1
+        self.symmetry_tables = np.array(create_symmetry_tables(create_symmetries(size)), dtype=np.int64)
+        self.chunk_size = chunk_size # positions canonicalized at once, bounds the temporary arrays
+
+    def canonical_keys(self, conf0, conf1):
+        """Keys of the canonical grids, computed by chunks of chunk_size positions."""
+        keys = np.empty(len(conf0), dtype=np.int64)
+        for start in range(0, len(conf0), self.chunk_size):
+            end = start + self.chunk_size
+            keys[start:end] = canonical_keys(conf0[start:end], conf1[start:end], self.symmetry_tables, self.n_cells)[0]
+        return keys
+
+    def _split(self, keys):
+        return keys & self.full, keys >> self.n_cells
+
+    def _is_win(self, conf):
+        won = np.zeros(len(conf), dtype=bool)
+        for mask in self.masks:
+            won |= (conf & mask) == mask
+        return won
+
+    def _children(self, conf0, conf1, player, cell):
+        """Positions (rows of the level) where cell is empty, and the canonical keys reached by playing it."""
+        rows = np.flatnonzero(((conf0 | conf1) >> cell) & 1 == 0)
+        bit = np.int64(1) << cell
+        if player == 0:
+            return rows, self.canonical_keys(conf0[rows] | bit, conf1[rows])
+        return rows, self.canonical_keys(conf0[rows], conf1[rows] | bit)
+
+    def enumerate_levels(self, root=(0, 0), max_entries=None, verbose=0):
+        """
+        Canonical positions reachable from root, one sorted array of keys per level, together with
+        the boolean array of the positions of each level where the game is over.
+        Raises MemoryError once more than max_entries positions have been found, or before a level is built
+        if the children of the previous one, duplicates included, are more than max_entries.
+        """
+        root_level = popcount(root[0] | root[1])
+        keys = self.canonical_keys(np.array([root[0]], dtype=np.int64), np.array([root[1]], dtype=np.int64))
+        levels, terminals = {root_level: keys}, {}
+        n_entries = 1
+        player = 0 if popcount(root[0]) == popcount(root[1]) else 1
+
+        for level in range(root_level, self.n_cells + 1):
+            conf0, conf1 = self._split(levels[level])
+            # the player that played last is the only one that can have just won
+            terminals[level] = self._is_win(conf1 if player == 0 else conf0) | ((conf0 | conf1) == self.full)
+            if level == self.n_cells:
+                break
+
+            conf0, conf1 = conf0[~terminals[level]], conf1[~terminals[level]]
+            # every open position of the level has n_cells - level children before deduplication
+            if max_entries is not None and len(conf0) * (self.n_cells - level) > max_entries:
+                raise MemoryError(f'more than {max_entries} positions reachable from {root}, level {level + 1} has {len(conf0) * (self.n_cells - level)} candidates')
+            children = [self._children(conf0, conf1, player, cell)[1] for cell in range(self.n_cells)]
+            levels[level + 1] = np.unique(np.concatenate(children))
+            n_entries += len(levels[level + 1])
+            if max_entries is not None and n_entries > max_entries:
+                raise MemoryError(f'more than {max_entries} positions reachable from {root}, level {level + 1} alone has {len(levels[level + 1])}')
+            if verbose >= 1:
+                print(f'LEVEL {level + 1}: {len(levels[level + 1])} POSITIONS')
+            player = 1 - player
+
+        return levels, terminals
+
+    def solve(self, root=(0, 0), max_entries=None, verbose=0):
+        """
+        Scores and best moves of all the positions reachable from root. Returns one (keys, packed) pair of
+        arrays per level, packed in the StrategyTable format, levels not reachable from root being empty.
+        """
+        levels, terminals = self.enumerate_levels(root, max_entries, verbose)
+        root_level = min(levels)
+        root_player = 0 if popcount(root[0]) == popcount(root[1]) else 1
+
+        scores, packed = {}, {}
+        for level in range(max(levels), root_level - 1, -1):
+            conf0, conf1 = self._split(levels[level])
+            # finished games are lost for the player to move, unless the board is full and nobody won
+            score = np.full(len(conf0), -1, dtype=np.int8)
+            score[terminals[level] & ~self._is_win(conf0) & ~self._is_win(conf1)] = 0
+            move = np.full(len(conf0), -1, dtype=np.int64)
+
+            open_rows = np.flatnonzero(~terminals[level])
+            if len(open_rows) > 0:
+                player = root_player if (level - root_level) % 2 == 0 else 1 - root_player
+                conf0, conf1 = conf0[open_rows], conf1[open_rows]
+                child_keys, child_scores = levels[level + 1], scores[level + 1]
+                best = np.full(len(open_rows), -1, dtype=np.int8)
+                best_move = np.full(len(open_rows), -1, dtype=np.int64)
+                for cell in range(self.n_cells):
+                    rows, keys_after = self._children(conf0, conf1, player, cell)
+                    value = -child_scores[np.searchsorted(child_keys, keys_after)]
+                    # strictly better only, so that ties keep the first move as in ESBot
+                    better = (value > best[rows]) | (best_move[rows] < 0)
+                    best[rows[better]] = value[better]
+                    best_move[rows[better]] = cell
+                score[open_rows] = best
+                move[open_rows] = best_move
+
+            scores[level] = score
+            scores.pop(level + 2, None) # only the next level is looked up
+            packed[level] = (((move + 1) << 2) | (score.astype(np.int64) + 1)).astype(np.uint8)
+            if verbose >= 1:
+                print(f'LEVEL {level} SOLVED')
+
+        empty = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint8))
+        return [(levels[level].astype(np.uint64), packed[level]) if level in levels else empty for level in range(self.n_cells + 1)]
+
+
+def solve_to_file(size, winning_configurations, path=None, root=(0, 0), max_entries=None, verbose=0):
+    """Solves the board from root and saves the tablebase as a StrategyTable, where ESBot looks for it by default."""
+    if path is None:
+        path = strategy_path(config.STRATEGY_DIR, size, winning_configurations)
+    levels = RetrogradeSolver(size, winning_configurations).solve(root, max_entries, verbose)
+    StrategyTable.save_levels(path, levels, size, winning_configurations)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solves a board with the retrograde solver and saves the tablebase.')
+    parser.add_argument('--size', type=int, default=3)
+    parser.add_argument('--k', type=int, default=None, help='marks in a row needed to win (default: size)')
+    parser.add_argument('--root', type=int, nargs=2, default=[0, 0], metavar=('CONF0', 'CONF1'), help='bitboards of the position to solve from')
+    parser.add_argument('--max-entries', type=int, default=None, help='stop if more positions than this are reachable')
+    parser.add_argument('--path', help='output file (default: the ESBot strategy file in config.STRATEGY_DIR)')
+    args = parser.parse_args()
+    if tuple(args.root) != (0, 0) and args.path is None:
+        parser.error('a table solved from --root only covers part of the game, give it its own --path')
+
+    start = time.perf_counter()
+    path = solve_to_file(args.size, create_win_grids(args.size, args.k), args.path, tuple(args.root), args.max_entries, verbose=1)
+    print(f'TABLEBASE SAVED TO {path} IN {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+class SearchStats:
+    """
+    Statistics of one MCTSBot search, filled only when the bot collects them.
+    Times are in seconds, depths and rollout lengths in plies.
+    """
+
+    PHASES = ['select', 'expand', 'simulate', 'backpropagate']
+
+    def __init__(self):
+        self.phase_time = {phase: 0.0 for phase in self.PHASES}
+        self.time_ms = 0.0
+        self.iterations = 0
+        self.nodes_allocated = 0
+        self.reused_visits = 0
+        self.root_forced = False    # the move was forced and no search was run
+        self.book_move = False      # the move came from the opening book and no search was run
+        self.root_proven = False    # the search stopped early because the value of the root was proven
+        self.proven_nodes = 0       # nodes whose value was proven during the search
+
+        self.max_depth = 0          # selection depth below the root
+        self.total_depth = 0
+        self.rollouts = 0
+        self.rollout_plies = 0
+        self.max_rollout_length = 0
+        self.forced_moves = 0       # forced moves played in rollouts
+
+        self.child_visits = {}      # move of each root child -> visits
+        self.child_values = {}      # move of each root child -> average value
+
+    @property
+    def average_depth(self):
+        return self.total_depth / self.iterations if self.iterations else 0.0
+
+    @property
+    def average_rollout_length(self):
+        return self.rollout_plies / self.rollouts if self.rollouts else 0.0
+
+    def as_dict(self):
+        return {'time_ms': self.time_ms, 'phase_time': dict(self.phase_time), 'iterations': self.iterations,
+                'nodes_allocated': self.nodes_allocated, 'reused_visits': self.reused_visits, 'root_forced': self.root_forced, 'book_move': self.book_move,
+                'root_proven': self.root_proven, 'proven_nodes': self.proven_nodes,
+                'max_depth': self.max_depth, 'average_depth': self.average_depth,
+                'rollouts': self.rollouts, 'average_rollout_length': self.average_rollout_length,
+                'max_rollout_length': self.max_rollout_length, 'forced_moves': self.forced_moves,
+                'child_visits': dict(self.child_visits), 'child_values': dict(self.child_values)}
+
+    def __repr__(self):
+        return f'SearchStats({self.as_dict()})'
\ No newline at end of file
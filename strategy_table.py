@@ -0,0 +1,164 @@
+import os
+import hashlib
+import numpy as np
+
+# File layout (little endian):
+#   header: magic (4 bytes), board size (uint32), number of entries (uint64), win-mask digest (16 bytes)
+#   level offsets: size * size + 2 uint64, entries with n moves on the board are in [offsets[n], offsets[n + 1])
+#   keys: one uint64 per position, sorted inside each level, the key of a grid is conf0 | conf1 << size * size
+#   packed: one uint8 per position, (best move + 1) << 2 | (score + 1), a best move of None is stored as 0
+
+MAGIC = b'TTTS'
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('size', '<u4'), ('n_entries', '<u8'), ('digest', 'S16')])
+
+
+def win_masks_digest(winning_configurations):
+    masks = ','.join(str(mask) for mask in sorted(winning_configurations))
+    return hashlib.sha1(masks.encode()).hexdigest()[:16].encode()
+
+def strategy_path(directory, size, winning_configurations, prefix='esbot'):
+    return os.path.join(directory, f'{prefix}_{size}_{win_masks_digest(winning_configurations).decode()}.bin')
+
+def grid_key(grid, size):
+    return grid[0] | (grid[1] << (size * size))
+
+def key_grid(key, size):
+    n_cells = size * size
+    return (key & ((1 << n_cells) - 1), key >> n_cells)
+
+
+def transform_bitboards(conf, symmetry_tables):
+    """
+    Images of an int64 array of bitboards under every symmetry, shape (n_symmetries, len(conf)).
+    symmetry_tables is the int64 array of utils.create_symmetry_tables.
+    """
+    transformed = np.zeros((len(symmetry_tables), len(conf)), dtype=np.int64)
+    for block in range(symmetry_tables.shape[1]):
+        transformed |= symmetry_tables[:, block, (conf >> (8 * block)) & 255]
+    return transformed
+
+def canonical_keys(conf0, conf1, symmetry_tables, n_cells):
+    """
+    Vectorized canonical_grid followed by grid_key: the keys of the canonical grids of the boards (int64)
+    and the index of the symmetry that gives each of them. The canonical grid is the symmetric image with
+    the smallest (conf0, conf1) tuple, that is the smallest conf0 << n_cells | conf1.
+    """
+    t0, t1 = transform_bitboards(conf0, symmetry_tables), transform_bitboards(conf1, symmetry_tables)
+    symmetry = ((t0 << n_cells) | t1).argmin(axis=0)
+    boards = np.arange(len(conf0))
+    return t0[symmetry, boards] | (t1[symmetry, boards] << n_cells), symmetry
+
+
+def level_arrays(level, size):
+    """Sorted keys and packed (move, score) of a dict {grid: (move, score)}, as stored in a StrategyTable."""
+    keys = np.array([grid_key(grid, size) for grid in level], dtype='<u8')
+    packed = np.array([((move + 1 if move is not None else 0) << 2) | (score + 1) for move, score in level.values()], dtype='u1')
+    order = np.argsort(keys)
+    return keys[order], packed[order]
+
+
+class StrategyLevel:
+    """Read only view of the positions of a StrategyTable that have the same number of moves played."""
+
+    def __init__(self, keys, packed, size):
+        self.keys = keys
+        self.packed = packed
+        self.size = size
+
+    def _index(self, grid):
+        key = grid_key(grid, self.size)
+        index = int(np.searchsorted(self.keys, key))
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return None
+
+    def __getitem__(self, grid):
+        index = self._index(grid)
+        if index is None:
+            raise KeyError(grid)
+        value = int(self.packed[index])
+        move = (value >> 2) - 1
+        return (None if move < 0 else move, (value & 3) - 1)
+
+    def __contains__(self, grid):
+        return self._index(grid) is not None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def items(self):
+        for i in range(len(self.keys)):
+            grid = key_grid(int(self.keys[i]), self.size)
+            yield grid, self[grid]
+
+
+class StrategyTable:
+    """
+    Solved strategy of ESBot stored in a compact binary file and read through a memory map,
+    so that every process loading the same file shares one read only copy of it.
+    Indexing by number of moves works like the dict-of-dicts built by ESBot.compute_optimal_strategy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise ValueError(f'{path} is not a strategy table')
+        self.size = int(header['size'])
+        self.digest = header['digest']
+        n_entries = int(header['n_entries'])
+        n_levels = self.size * self.size + 1
+
+        offset = HEADER_DTYPE.itemsize
+        self.offsets = np.memmap(path, dtype='<u8', mode='r', offset=offset, shape=(n_levels + 1,))
+        offset += self.offsets.nbytes
+        self.keys = np.memmap(path, dtype='<u8', mode='r', offset=offset, shape=(n_entries,))
+        offset += self.keys.nbytes
+        self.packed = np.memmap(path, dtype='u1', mode='r', offset=offset, shape=(n_entries,))
+
+        self.levels = [StrategyLevel(self.keys[self.offsets[n]:self.offsets[n + 1]], self.packed[self.offsets[n]:self.offsets[n + 1]], self.size)
+                       for n in range(n_levels)]
+
+    def __getitem__(self, n_moves):
+        return self.levels[n_moves]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def matches(self, size, winning_configurations):
+        return self.size == size and self.digest == win_masks_digest(winning_configurations)
+
+    @staticmethod
+    def save(path, seen_by_moves, size, winning_configurations):
+        """Writes a dict-of-dicts strategy to path. The file is replaced atomically."""
+
+        levels = [level_arrays(seen_by_moves.get(n_moves, {}), size) for n_moves in range(size * size + 1)]
+        StrategyTable.save_levels(path, levels, size, winning_configurations)
+
+    @staticmethod
+    def save_levels(path, levels, size, winning_configurations):
+        """
+        Writes a strategy given as one (sorted keys, packed) pair of arrays per number of moves played,
+        in the layout described at the top of this file. The file is replaced atomically.
+        """
+
+        if 2 * size * size > 64:
+            raise ValueError(f'Grids of size {size} do not fit in a 64 bit key')
+
+        n_levels = size * size + 1
+        offsets = np.zeros(n_levels + 1, dtype='<u8')
+        for n_moves in range(n_levels):
+            offsets[n_moves + 1] = offsets[n_moves] + len(levels[n_moves][0])
+
+        header = np.array([(MAGIC, size, offsets[-1], win_masks_digest(winning_configurations))], dtype=HEADER_DTYPE)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            header.tofile(f)
+            offsets.tofile(f)
+            for keys, _ in levels:
+                np.asarray(keys).astype('<u8').tofile(f)
+            for _, packed in levels:
+                np.asarray(packed).astype('u1').tofile(f)
+        os.replace(tmp_path, path)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from MCSTBot_class import MCTSBot
+from esbot_class import ESBot
+from utils import create_win_grids, canonical_grid, popcount, empty_cells, play_move, is_win, is_full
+
+# The MCTS-Solver checked against the exact values of the ESBot table: python -m pytest test_mcts_solver.py
+
+
+@pytest.fixture(scope='module')
+def esbot():
+    return ESBot(3, create_win_grids(3), strategy_dir=None)
+
+
+def exact_score(esbot, grid):
+    """Value of grid for the player to move, from the ESBot table."""
+    canonical, _ = canonical_grid(grid, esbot.symmetry_tables)
+    return esbot.strategy[popcount(grid[0] | grid[1])][canonical][1]
+
+
+def random_positions(n_positions, seed):
+    """Positions of random 3x3 games that are not over, with the player to move."""
+    rng = random.Random(seed)
+    winning_configurations = create_win_grids(3)
+    positions = []
+    while len(positions) < n_positions:
+        grid, player = (0, 0), 0
+        for _ in range(rng.randint(0, 7)):
+            grid = play_move(grid, player, rng.choice([move for move in range(9) if not (grid[0] | grid[1]) >> move & 1]))
+            player = 1 - player
+            if is_win(grid, winning_configurations):
+                break
+        if not is_win(grid, winning_configurations) and not is_full(grid, 3):
+            positions.append((grid, player))
+    return positions
+
+
+@pytest.mark.parametrize('rave_k', [None, 30])
+def test_proofs_and_moves_match_the_table(esbot, rave_k):
+    winning_configurations = create_win_grids(3)
+    for i, (grid, player) in enumerate(random_positions(60, seed=1)):
+        bot = MCTSBot(3, winning_configurations, player, reuse_tree=False, seed=i, node_budget=1000, rave_k=rave_k)
+        move = bot.next_move(grid, empty_cells(grid, 3))
+
+        tree = bot.tree
+        for node in range(len(tree)):
+            if tree.proven[node] != tree.UNKNOWN:
+                assert tree.proven[node] == exact_score(esbot, tree.state(node)), tree.state(node)
+        assert -exact_score(esbot, play_move(grid, player, move)) == exact_score(esbot, grid), (grid, move)
+
+
+def test_rave_credits_only_rollouts_of_the_leaf():
+    # proven leaves skip the rollout, the AMAF update must not reuse the moves of an earlier one
+    bot = MCTSBot(3, create_win_grids(3), 0, reuse_tree=False, seed=0, node_budget=3000, rave_k=30, collect_stats=True)
+    backpropagate_amaf = bot._backpropagate_amaf
+
+    def checked(path, result):
+        leaf = int(bot.tree.child[path[-1]]) if path else bot.root
+        taken = bot.tree.state0[leaf] | bot.tree.state1[leaf]
+        assert (bot.rollout_moves[0] | bot.rollout_moves[1]) & int(taken) == 0
+        backpropagate_amaf(path, result)
+
+    bot._backpropagate_amaf = checked
+    bot.next_move((0, 0), empty_cells((0, 0), 3))
+    # the scenario needs simulations that reached proven leaves
+    assert bot.last_stats.rollouts < bot.last_stats.iterations
+
+
+def test_root_parallel_search_plays_proven_wins(esbot):
+    winning_configurations = create_win_grids(3)
+    won = [(grid, player) for grid, player in random_positions(200, seed=2) if exact_score(esbot, grid) == 1][:20]
+    bots = {player: MCTSBot(3, winning_configurations, player, n_workers=2, seed=player) for player in (0, 1)}
+    try:
+        for grid, player in [((258, 5), 0), ((32, 128), 0)] + won:
+            move = bots[player].next_move(grid, empty_cells(grid, 3))
+            assert exact_score(esbot, play_move(grid, player, move)) == -1, (grid, move)
+    finally:
+        for bot in bots.values():
+            bot.close()
@@ -1,19 +1,33 @@
-import numpy as np
-from esbot_class import ESBot
-from MCSTBot_class import MCTSBot
+import importlib
+import numbers
+import time
+from game_state import LineIndex, GameState
 from utils import *
-import os
-from IPython.display import clear_output
+from game_records import game_record, move_stats
 import config
 
 #import keyboard
 
+# the bot modules pull in NumPy and the solvers, they are imported only when a bot is asked for by name
+BOT_MODULES = {'ESBot': 'esbot_class', 'MCTSBot': 'MCSTBot_class', 'AlphaBetaBot': 'alphabetabot_class'}
+
+def load_bot_class(name):
+    return getattr(importlib.import_module(BOT_MODULES[name]), name)
+
+
 class TicTacToe:
-    def __init__(self, grid_size: int):
+    def __init__(self, grid_size: int, win_length: int = None, headless: bool = False):
+        """
+        grid_size x grid_size board where win_length marks in a row win (grid_size if not given).
+        With headless = True the game prints nothing, the return values of the methods are unchanged.
+        """
         self.size = grid_size
-        self.grid = [0,0]
-        self.valid_plays = [i for i in range(self.size**2)]
-        self.winning_configurations = create_win_grids(self.size)
+        self.headless = headless
+        self.win_length = grid_size if win_length is None else win_length
+        self.winning_configurations = create_win_grids(self.size, k=self.win_length)
+        self.line_index = LineIndex(self.size, self.winning_configurations)
+        self.state = GameState(self.line_index)
+        self.grid = self.state.grid # kept up to date by self.state
 
         self.player0 = None
         self.player1 = None
@@ -23,92 +37,84 @@ class TicTacToe:
     def _play(self, player, position):
 
         if self.player0 is None or self.player1 is None:
-            print('Players not set up')
+            self._print('Players not set up')
             return 0
         
         if player not in [self.player0,self.player1]:
-            print('Player not allowed')
+            self._print('Player not allowed')
             return 0
         
         if self._check_status() == 1: 
-            print('The game is already over')
+            self._print('The game is already over')
             return 0
         
-        if position not in self.valid_plays:
-            print('Play not allowed! Try again')
+        if not isinstance(position, numbers.Integral) or not 0 <= position < self.size**2 or not self.empty_cells & (1 << position):
+            self._print('Play not allowed! Try again')
             return -1
         
-        if np.sum(bin(self.grid[0]).count('1')) == np.sum(bin(self.grid[1]).count('1')) + 1 and player == self.player0:
-            print(f'Player {self.player0} cannot play twice in a row')
+        if self.state.n_moves % 2 == 1 and player == self.player0:
+            self._print(f'Player {self.player0} cannot play twice in a row')
             return 0
         
-        if np.sum(bin(self.grid[0]).count('1')) == np.sum(bin(self.grid[1]).count('1')) and player == self.player1:
-            print(f'Player {self.player1} cannot play twice in a row')
+        if self.state.n_moves % 2 == 0 and player == self.player1:
+            self._print(f'Player {self.player1} cannot play twice in a row')
             return 0
         
-        if player == self.player0:
-            self.grid[0] |= (1 << position)
-        else:
-            self.grid[1] |= (1 << position)
-        
-        self.valid_plays.remove(position)
-        
-        if is_win(self.grid, self.winning_configurations):
+        if self.state.play(position, self.state.n_moves % 2):
             self.winner = player
             return 1
         
 
+    def _print(self, *args, **kwargs):
+        if not self.headless:
+            print(*args, **kwargs)
+
+    @property
+    def empty_cells(self):
+        """Bitmask of the valid plays."""
+        return empty_cells(self.grid, self.size)
+
+    @property
+    def valid_plays(self):
+        return mask_to_moves(self.empty_cells)
+
     def _check_status(self):
-        if is_win(self.grid, self.winning_configurations) == 1 or is_full(self.grid, self.size) == 1:
+        if self.state.is_over():
             return 1
         return 0
 
     
     def _display_board(self):
-
-        bin0 = np.array(list(bin(self.grid[0])[2:].zfill(self.size**2)[::-1]), dtype=int)
-        bin1 = np.array(list(bin(self.grid[1])[2:].zfill(self.size**2)[::-1]), dtype=int)
-
-        board_grid = (bin0 - bin1).reshape(self.size, self.size)  
-
-        for i, row in enumerate(board_grid):
-
-            row_display = " | ".join('X' if cell == 1 else 'O' if cell == -1 else ' ' for cell in row)
-            
-            print(" " + row_display + " ")
-
-            if i < len(board_grid) - 1:
-                print("---+" * (self.size - 1) + "---")
+        if not self.headless:
+            display_board(self.grid, self.size)
 
 
     def _SetUpGame(self, player0, player1):
 
         if not isinstance(player0, str):
-            raise ValueError('player1 must be a string: name of the human player, "ESBot" or "MCTSBot"')
+            raise ValueError('player1 must be a string: name of the human player, "ESBot", "MCTSBot" or "AlphaBetaBot"')
         if not isinstance(player1, str):
-            raise ValueError('player2 must be a string: name of the human player, "ESBot" or "MCTSBot"')
-        
-        if player0 == 'ESBot':
-            self.player0 = ESBot(self.size, self.winning_configurations)
-        elif player0 == 'MCTSBot':
-            self.player0 = MCTSBot(self.size, self.winning_configurations, 0)
-        else:
-            self.player0 = player0
+            raise ValueError('player2 must be a string: name of the human player, "ESBot", "MCTSBot" or "AlphaBetaBot"')
         
-        if player1 == 'ESBot':
-            self.player1 = ESBot(self.size, self.winning_configurations)
-        elif player1 == 'MCTSBot':
-            self.player1 = MCTSBot(self.size, self.winning_configurations, 1)
-        else:
-            self.player1 = player1
+        self.player0 = self._make_player(player0, 0)
+        self.player1 = self._make_player(player1, 1)
         
         self.current_player = self.player0
-        print(f'\nPlayer 1: {self.player0} will play as X')
-        print(f'\nPlayer 2: {self.player1} will play as O')
+        self._print(f'\nPlayer 1: {self.player0} will play as X')
+        self._print(f'\nPlayer 2: {self.player1} will play as O')
+
+    def _make_player(self, name, player):
+        """The bot called name, or name itself for a human player."""
+        if name not in BOT_MODULES:
+            return name
+        bot_class = load_bot_class(name)
+        if name == 'ESBot':
+            return bot_class(self.size, self.winning_configurations)
+        return bot_class(self.size, self.winning_configurations, player)
 
     def _reset_game(self):
-        self.grid = [0,0]
-        self.valid_plays = [i for i in range(self.size**2)]
+        self.state = GameState(self.line_index)
+        self.grid = self.state.grid
         self.winner = None
         self.current_player = None
 
@@ -124,32 +130,29 @@ class TicTacToe:
             #clear_output(wait=False)
             # print(f'\nPlayer 1: {self.player0} will play as X')
             # print(f'Player 2: {self.player1} will play as O')
-            print("\nCurrent Board:")
+            self._print("\nCurrent Board:")
             self._display_board() 
 
-            if isinstance(self.current_player, ESBot):
-                position = self.current_player.next_move(self.grid) 
-            
-            elif isinstance(self.current_player, MCTSBot):
-                position = self.current_player.next_move(self.grid, self.valid_plays) 
+            if not isinstance(self.current_player, str):
+                position = self.current_player.next_move(self.grid, self.empty_cells) 
             
             else:
                 user_input = input(f"{self.current_player}, enter row (0,{self.size-1}) and column (0,{self.size-1}) separated by space (press 'enter' to exit the game)")
 
                 if user_input in "":
-                    print("\nGame stopped by user (quit command).")
+                    self._print("\nGame stopped by user (quit command).")
                     break
                 
                 try:
                     row, col = map(int, user_input.split())
 
                     if (row < 0 or row >= self.size) or (col < 0 or col >= self.size):
-                        print(f"Invalid input. enter row (0,{self.size-1}) and column (0,{self.size-1}) separated by space (press 'enter' to exit the game)")
+                        self._print(f"Invalid input. enter row (0,{self.size-1}) and column (0,{self.size-1}) separated by space (press 'enter' to exit the game)")
                         continue
 
                     position = row * self.size + col  # convert it into a position
                 except ValueError:
-                    print(f"Invalid input. enter row (0,{self.size-1}) and column (0,{self.size-1}) separated by space (press 'enter' to exit the game)")
+                    self._print(f"Invalid input. enter row (0,{self.size-1}) and column (0,{self.size-1}) separated by space (press 'enter' to exit the game)")
                     continue
                 
                 
@@ -159,6 +162,8 @@ class TicTacToe:
                 break  # Stop loop since the game has ended
 
             if status == -1: # Invalid move do not switch player
+                if not isinstance(self.current_player, str):
+                    raise ValueError(f'{self.current_player} played the illegal move {position}')
                 continue
             
             # Switch player
@@ -167,44 +172,55 @@ class TicTacToe:
         # Game has ended, show final board and result
         #
         #clear_output(wait=True)
-        print(f'\nPlayer 1: {self.player0} will play as X')
-        print(f'Player 2: {self.player1} will play as O')
-        print("\nFinal Board:")
+        self._print(f'\nPlayer 1: {self.player0} will play as X')
+        self._print(f'Player 2: {self.player1} will play as O')
+        self._print("\nFinal Board:")
         self._display_board()
         
         if self.winner:
-            print(f"Congratulations! {self.current_player} wins! 🎉")
+            self._print(f"Congratulations! {self.current_player} wins! 🎉")
         else:
-            print("It's a draw! 🤝")
+            self._print("It's a draw! 🤝")
 
-    def automatic_games(self, player0, player1, debug=False):
-        """Starts an interactive Tic-Tac-Toe game loop."""
+    def automatic_games(self, player0, player1, debug=False, recorder=None):
+        """
+        Starts an interactive Tic-Tac-Toe game loop.
+        recorder: if given (see game_records.py), the moves, the think time of each move and the result are added to it.
+        """
 
         # Reset game state
         self._reset_game()
 
-        if not isinstance(player0, ESBot) and not isinstance(player0, MCTSBot):
-            raise ValueError('player1 must be an instance of ESBot or MCTSBot')
-        if not isinstance(player1, ESBot) and not isinstance(player1, MCTSBot):
-            raise ValueError('player2 must be an instance of ESBot or MCTSBot')
+        if not callable(getattr(player0, 'next_move', None)):
+            raise ValueError('player1 must be a bot, for instance an ESBot, MCTSBot or AlphaBetaBot')
+        if not callable(getattr(player1, 'next_move', None)):
+            raise ValueError('player2 must be a bot, for instance an ESBot, MCTSBot or AlphaBetaBot')
         
         ### in this case the bot will be initialized externally and passed as an argument
         self.player0 = player0
         self.player1 = player1
         
         self.current_player = self.player0
+        if recorder is not None:
+            moves, think_ms, stats = [], [], []
         
         while self._check_status() == 0:
 
-            position = None
-
-            if isinstance(self.current_player, ESBot):
-                position = self.current_player.next_move(self.grid) 
-            
-            elif isinstance(self.current_player, MCTSBot):
-                position = self.current_player.next_move(self.grid, self.valid_plays) 
+            if recorder is None:
+                position = self.current_player.next_move(self.grid, self.empty_cells) 
+            else:
+                start = time.perf_counter()
+                position = self.current_player.next_move(self.grid, self.empty_cells) 
+                elapsed_ms = (time.perf_counter() - start) * 1000
                 
-            _ = self._play(self.current_player, position)
+            status = self._play(self.current_player, position)
+            if status == -1:
+                # switching players would let the bot skip its turn, and keeping it would loop forever
+                raise ValueError(f'{self.current_player} played the illegal move {position}')
+            if recorder is not None and status in (None, 1):
+                moves.append(position)
+                think_ms.append(elapsed_ms)
+                stats.append(move_stats(self.current_player))
 
             if self.winner != None:
                 break 
@@ -213,13 +229,13 @@ class TicTacToe:
 
         # Game has ended, show final board and result
         if debug:
-            print("\nFinal Board:")
+            self._print("\nFinal Board:")
             self._display_board()
         
-        if self.winner:
-            return self.game_winner()
-        else:
-            return 0
+        result = self.game_winner() if self.winner else 0
+        if recorder is not None:
+            recorder.add(game_record(self.size, self.win_length, [self.player0, self.player1], moves, think_ms, result, stats))
+        return result
         
     def game_winner(self):
         
@@ -0,0 +1,151 @@
+import inspect
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tictactoe_class import TicTacToe
+from game_records import MemoryRecorder
+
+
+def wilson_interval(successes, n, z=1.96):
+    """Wilson score confidence interval of a proportion (95% by default)."""
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+
+class Standings:
+    """Running results of a tournament between the bot playing first and the bot playing second."""
+
+    def __init__(self, name0, name1, num_games):
+        self.name0 = name0
+        self.name1 = name1
+        self.num_games = num_games
+        self.results = {0: 0, 1: 0, 2: 0} # same keys as TicTacToe.automatic_games: 0 draw, 1 first bot won, 2 second bot won
+
+    @property
+    def played(self):
+        return sum(self.results.values())
+
+    def rates(self):
+        return {self.name0: self.results[1] / self.played, self.name1: self.results[2] / self.played, 'draws': self.results[0] / self.played}
+
+    def intervals(self, z=1.96):
+        return {self.name0: wilson_interval(self.results[1], self.played, z),
+                self.name1: wilson_interval(self.results[2], self.played, z),
+                'draws': wilson_interval(self.results[0], self.played, z)}
+
+    def __str__(self):
+        lines = [f'{self.played}/{self.num_games} games, {self.name0} playing first, {self.name1} playing second']
+        intervals = self.intervals()
+        for name, rate in self.rates().items():
+            low, high = intervals[name]
+            lines.append(f'\t{name}: {rate:.2%} (95% CI {low:.2%} - {high:.2%})')
+        return '\n'.join(lines)
+
+
+def make_bot(bot_class, size, winning_configurations, player, kwargs=None):
+    """Builds a bot, passing the player only to the bots that need to know it."""
+    kwargs = kwargs or {}
+    if 'player' in inspect.signature(bot_class).parameters:
+        return bot_class(size, winning_configurations, player, **kwargs)
+    return bot_class(size, winning_configurations, **kwargs)
+
+def game_seed(seed, game_index):
+    return (seed * 1_000_003 + game_index) % (2 ** 63)
+
+def seed_bot(bot, seed):
+    """Resets the bot for a new game and reseeds its random generators."""
+    if hasattr(bot, 'reset'):
+        bot.reset()
+    if hasattr(bot, 'random'):
+        bot.random.seed(seed)
+    if hasattr(bot, 'rng'):
+        import numpy as np # only bots that already use NumPy have an rng
+        bot.rng = np.random.default_rng(seed)
+
+
+# game and bots built once by each worker process
+_worker_game = None
+_worker_bots = None
+
+def _init_worker(game_size, spec0, spec1, win_length=None):
+    global _worker_game, _worker_bots
+    _worker_game = TicTacToe(game_size, win_length, headless=True)
+    _worker_bots = [make_bot(spec0[0], game_size, _worker_game.winning_configurations, 0, spec0[1]),
+                    make_bot(spec1[0], game_size, _worker_game.winning_configurations, 1, spec1[1])]
+
+def _play_games(game_indices, seed, record=False):
+    results = []
+    recorder = MemoryRecorder() if record else None
+    for game_index in game_indices:
+        s = game_seed(seed, game_index)
+        random.seed(s)
+        seed_bot(_worker_bots[0], s)
+        seed_bot(_worker_bots[1], s + 1)
+        results.append(_worker_game.automatic_games(_worker_bots[0], _worker_bots[1], recorder=recorder))
+        if record:
+            recorder.records[-1]['seed'] = s
+    # the records travel back with the results and are written by the main process
+    return results, recorder.records if record else None
+
+
+def run_tournament(game_size, bot0, bot1, num_games, n_workers=None, seed=0, chunk_size=None, recorder=None, win_length=None):
+    """
+    Plays num_games games between bot0 (first player) and bot1 (second player) over a process pool
+    and yields the updated Standings every time a chunk of games is completed.
+    - bot0, bot1: bot classes, or (bot class, constructor kwargs) tuples. Each worker builds them once.
+    - seed: game i is always played with the seed derived from (seed, i), whatever the number of workers,
+      so the final results can be reproduced.
+    - recorder: GameRecorder receiving the record of every game, with the seed it was played with.
+    - win_length: marks in a row needed to win (game_size if not given), the bots get the matching winning configurations.
+    """
+
+    spec0 = bot0 if isinstance(bot0, tuple) else (bot0, {})
+    spec1 = bot1 if isinstance(bot1, tuple) else (bot1, {})
+    name0, name1 = spec0[0].__name__, spec1[0].__name__
+    if name0 == name1:
+        name0, name1 = f'{name0} (first)', f'{name1} (second)'
+
+    n_workers = n_workers or os.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(1, min(100, num_games // (4 * n_workers)))
+
+    standings = Standings(name0, name1, num_games)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(game_size, spec0, spec1, win_length)) as executor:
+        futures = [executor.submit(_play_games, range(start, min(start + chunk_size, num_games)), seed, recorder is not None)
+                   for start in range(0, num_games, chunk_size)]
+        for future in as_completed(futures):
+            results, records = future.result()
+            for result in results:
+                standings.results[result] += 1
+            if recorder is not None:
+                for record in records:
+                    recorder.add(record)
+            yield standings
+
+
+def tournament(game_size, bot0, bot1, num_games, n_workers=None, seed=0, verbose=True, recorder=None, win_length=None):
+    """Runs run_tournament to the end and returns the final Standings, printing the progress if verbose."""
+
+    standings = None
+    for standings in run_tournament(game_size, bot0, bot1, num_games, n_workers, seed, recorder=recorder, win_length=win_length):
+        if verbose:
+            print(f'\r{standings.played}/{num_games} games played', end='')
+    if verbose:
+        print()
+        print(standings)
+    return standings
+
+def evaluate_bot_parallel(game_size, num_games, bot, benchmark_bot, n_workers=None, seed=0, verbose=True, recorder=None, win_length=None):
+    """Parallel version of utils.evaluate_bot: num_games with bot playing first and num_games with bot playing second."""
+
+    first = tournament(game_size, bot, benchmark_bot, num_games, n_workers, seed, verbose, recorder, win_length)
+    second = tournament(game_size, benchmark_bot, bot, num_games, n_workers, seed + 1, verbose, recorder, win_length)
+    return {'wins': first.results[1] + second.results[2],
+            'losses': first.results[2] + second.results[1],
+            'draws': first.results[0] + second.results[0]}
\ No newline at end of file
@@ -1,44 +1,115 @@
-import numpy as np
 import os 
 import time
 import math
-from tqdm import tqdm
 import config
 
 
-def create_win_grids(size=3):
+class WinConfigurations(list):
+    """
+    List of the winning masks of a board that also knows the shape of the board,
+    so that is_win can look for k in a row with shifts instead of scanning every mask.
+    Scanning is faster when there are only a few masks, so shifts are used only on larger boards.
+    """
+    def __init__(self, masks, n_rows, n_cols, k):
+        super().__init__(masks)
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.k = k
+        self.directions = None
+        if len(masks) > config.SHIFT_WIN_CHECK_MIN_LINES:
+            self.directions = create_shift_directions(n_rows, n_cols, k)
+
+
+def create_win_grids(size=3, k=None, n_cols=None):
+    """
+    Winning masks of a board with size rows and n_cols columns (n_cols = size if not given)
+    where k marks in a row win (k = size if not given): one mask for every k consecutive
+    cells of a row, a column, a diagonal or an anti diagonal.
+    """
+    n_rows = size
+    n_cols = size if n_cols is None else n_cols
+    k = size if k is None else k
     winning_masks = []
     
     # Win over rows
-    for row in range(size):
-        mask = 0
-        for col in range(size):
-            mask += 1 << (row * size + col)
-        winning_masks.append(mask) 
+    for row in range(n_rows):
+        for start in range(n_cols - k + 1):
+            mask = 0
+            for col in range(start, start + k):
+                mask += 1 << (row * n_cols + col)
+            winning_masks.append(mask) 
       
     # Win over columns  
-    for col in range(size):
-        mask = 0
-        for row in range(size):
-            mask += 1 << (row * size + col)
-        winning_masks.append(mask) 
+    for col in range(n_cols):
+        for start in range(n_rows - k + 1):
+            mask = 0
+            for row in range(start, start + k):
+                mask += 1 << (row * n_cols + col)
+            winning_masks.append(mask) 
     
-    # Win over main diag
-    mask = 0
-    for row in range(size):
-        mask += 1 << (row * size + row)
-    winning_masks.append(mask)
-    # Win over anti diag
-    mask = 0
-    for row in range(size):
-        mask += 1 << (row * size + (size - row - 1))
-    winning_masks.append(mask)
+    # Win over diagonals
+    for start_row in range(n_rows - k + 1):
+        for start_col in range(n_cols - k + 1):
+            mask = 0
+            for i in range(k):
+                mask += 1 << ((start_row + i) * n_cols + start_col + i)
+            winning_masks.append(mask)
+    # Win over anti diagonals
+    for start_row in range(n_rows - k + 1):
+        for start_col in range(k - 1, n_cols):
+            mask = 0
+            for i in range(k):
+                mask += 1 << ((start_row + i) * n_cols + start_col - i)
+            winning_masks.append(mask)
     
-    return winning_masks
+    return WinConfigurations(winning_masks, n_rows, n_cols, k)
+
+def create_shift_directions(n_rows, n_cols, k):
+    """
+    For each direction (row, column, diagonal, anti diagonal) returns the shift between two consecutive
+    cells and the mask of the cells where k in a row can start without leaving the board.
+    """
+    def start_mask(valid):
+        mask = 0
+        for row in range(n_rows):
+            for col in range(n_cols):
+                if valid(row, col):
+                    mask |= 1 << (row * n_cols + col)
+        return mask
+
+    directions = [(1, start_mask(lambda row, col: col <= n_cols - k)),
+                  (n_cols, start_mask(lambda row, col: row <= n_rows - k)),
+                  (n_cols + 1, start_mask(lambda row, col: col <= n_cols - k and row <= n_rows - k)),
+                  (n_cols - 1, start_mask(lambda row, col: col >= k - 1 and row <= n_rows - k))]
+    return [(shift, mask) for shift, mask in directions if mask and (shift > 0 or k == 1)]
+
+def has_k_in_row(conf, directions, k):
+    """
+    True if conf has k marks in a row. In each direction the runs are doubled in length with
+    one shift-and-AND per step, so the cost depends on log(k) and not on the size of the board.
+    """
+    for shift, start_mask in directions:
+        run, length = conf, 1
+        while 2 * length <= k:
+            run &= run >> (shift * length)
+            length *= 2
+        if length < k:
+            run &= run >> (shift * (k - length))
+        if run & start_mask:
+            return True
+    return False
 
 def is_win(grid, winning_configurations):
 
         player0, player1 = grid
+        directions = getattr(winning_configurations, 'directions', None)
+        if directions is not None:
+            if has_k_in_row(player0, directions, winning_configurations.k):
+                return 1
+            if has_k_in_row(player1, directions, winning_configurations.k):
+                return 2
+            return 0
+
         for config in winning_configurations:
             if (player0 & config) == config:
                 return 1
@@ -53,6 +124,58 @@ def is_full(grid, size):
     return 0
 
 
+# Sets of moves are bitmasks, bit i being set when cell i is in the set
+
+if hasattr(int, 'bit_count'):
+    def popcount(mask):
+        return mask.bit_count()
+else:
+    def popcount(mask):
+        return bin(mask).count('1')
+
+def empty_cells(grid, size):
+    """Bitmask of the empty cells of grid, that is of the valid moves."""
+    return ((1 << (size * size)) - 1) & ~(grid[0] | grid[1])
+
+def moves_to_mask(moves):
+    mask = 0
+    for move in moves:
+        mask |= 1 << move
+    return mask
+
+def as_move_mask(moves):
+    """Bitmask of a set of moves given either as a bitmask or as a list of cells."""
+    return moves if isinstance(moves, int) else moves_to_mask(moves)
+
+def iter_moves(mask):
+    """Yields the moves of a bitmask in increasing order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+# moves of each value of the k-th byte of a bitmask, so that a mask is turned into moves one byte at a time
+_BYTE_MOVES = [[tuple(8 * k + bit for bit in range(8) if byte >> bit & 1) for byte in range(256)] for k in range(8)]
+
+def _moves_tuple(mask):
+    moves, k = (), 0
+    while mask:
+        if k < len(_BYTE_MOVES):
+            moves += _BYTE_MOVES[k][mask & 255]
+        else:
+            moves += tuple(8 * k + bit for bit in range(8) if mask >> bit & 1)
+        mask >>= 8
+        k += 1
+    return moves
+
+def mask_to_moves(mask):
+    return list(_moves_tuple(mask))
+
+def random_move(mask, rng):
+    """Uniformly random move of a non empty bitmask, rng being a random.Random."""
+    return rng.choice(_moves_tuple(mask))
+
+
 def play_move(grid, player, move):
     if (grid[0] | grid[1]) & (1 << move) != 0:
         print('MOVE NOT ALLOWED')
@@ -68,53 +191,117 @@ def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 
-def compute_ucb(leaf):
-    if leaf.parent is None:
-        print('CANNOT COMPUTE UCB FOR THE ROOT')
-        return None
-    if leaf.N == 0:
-        return math.inf
-    return leaf.V/leaf.N + 2* math.sqrt((2 * math.log(leaf.parent.N)) /leaf.N)
+def board_lines(grid, size):
+    """Text rows of the board, X for player 0 and O for player 1."""
+    lines = []
+    for row in range(size):
+        cells = []
+        for col in range(size):
+            bit = 1 << (row * size + col)
+            cells.append('X' if grid[0] & bit else 'O' if grid[1] & bit else ' ')
+        lines.append(" " + " | ".join(cells) + " ")
+        if row < size - 1:
+            lines.append("---+" * (size - 1) + "---")
+    return lines
 
 def display_board(grid, size):
-
-    bin0 = np.array(list(bin(grid[0])[2:].zfill(size**2)[::-1]), dtype=int)
-    bin1 = np.array(list(bin(grid[1])[2:].zfill(size**2)[::-1]), dtype=int)
-
-    board_grid = (bin0 - bin1).reshape(size, size)  
-
-    for i, row in enumerate(board_grid):
-
-        row_display = " | ".join('X' if cell == 1 else 'O' if cell == -1 else ' ' for cell in row)
-        
-        print(" " + row_display + " ")
-
-        if i < len(board_grid) - 1:
-            print("---+" * (size - 1) + "---")
+    print("\n".join(board_lines(grid, size)))
             
             
 def is_move_forced(grid, winning_configurations, size):
     conf1, conf2 = grid
+    missing_one = getattr(winning_configurations, 'k', size) - 1
     for configuration in winning_configurations:
-        if bin(configuration & conf1).count('1') == (size - 1) and bin(configuration & conf2).count('1') == 0:
+        if popcount(configuration & conf1) == missing_one and configuration & conf2 == 0:
             #print(configuration & ~conf1)
-            return int(math.log2(configuration & ~conf1))
-        if bin(configuration & conf2).count('1') == (size - 1) and bin(configuration & conf1).count('1') == 0:
+            return (configuration & ~conf1).bit_length() - 1
+        if popcount(configuration & conf2) == missing_one and configuration & conf1 == 0:
             #print(configuration & ~conf2)
-            return int(math.log2(configuration & ~conf2))
+            return (configuration & ~conf2).bit_length() - 1
     return None
 
 
-
-def multiple_games(game, num_games, bot1, bot2):
+def create_symmetries(size):
+    """
+    Returns the 8 symmetries (rotations and reflections) of a size x size board.
+    Each symmetry is a list where the item in position i is the cell where cell i is sent.
+    The first symmetry is the identity.
+    """
+    symmetries = []
+    for rotation in range(4):
+        for reflection in [False, True]:
+            symmetry = []
+            for cell in range(size * size):
+                row, col = divmod(cell, size)
+                if reflection:
+                    col = size - 1 - col
+                for _ in range(rotation):
+                    row, col = col, size - 1 - row
+                symmetry.append(row * size + col)
+            symmetries.append(symmetry)
+    return symmetries
+
+def invert_symmetry(symmetry):
+    inverse = [0] * len(symmetry)
+    for cell, image in enumerate(symmetry):
+        inverse[image] = cell
+    return inverse
+
+def create_symmetry_tables(symmetries):
+    """
+    For each symmetry builds a lookup table per block of 8 cells, so that a whole
+    bitboard can be transformed with one lookup per byte instead of one per cell.
+    """
+    n_cells = len(symmetries[0])
+    tables = []
+    for symmetry in symmetries:
+        blocks = []
+        for start in range(0, n_cells, 8):
+            block = [0] * 256
+            for byte in range(256):
+                for bit in range(8):
+                    if byte & (1 << bit) and start + bit < n_cells:
+                        block[byte] |= 1 << symmetry[start + bit]
+            blocks.append(block)
+        tables.append(blocks)
+    return tables
+
+def transform_grid(grid, table):
+    transformed = []
+    for conf in grid:
+        result = 0
+        for block in table:
+            result |= block[conf & 255]
+            conf >>= 8
+        transformed.append(result)
+    return tuple(transformed)
+
+def canonical_grid(grid, symmetry_tables):
+    """
+    Returns the smallest among the symmetric images of the grid, together with
+    the index of the symmetry that produces it.
+    """
+    best_grid, best_symmetry = None, None
+    for i, table in enumerate(symmetry_tables):
+        transformed = transform_grid(grid, table)
+        if best_grid is None or transformed < best_grid:
+            best_grid, best_symmetry = transformed, i
+    return best_grid, best_symmetry
+
+
+
+def multiple_games(game, num_games, bot1, bot2, recorder=None):
+    """Plays num_games games between bot1 (first player) and bot2, recorder being passed to automatic_games."""
 
     player0 = bot1
     player1 = bot2
     
+    from tqdm import tqdm
+
     results = {0: 0, 1: 0, 2: 0}
 
     for _ in tqdm(range(num_games), desc="Playing Games", unit="game"):
-        output = game.automatic_games(player0, player1)
+        output = game.automatic_games(player0, player1, recorder=recorder)
         results[output] += 1
 
     print(f'\nBot {player0} is playing as first player, Bot {player1} is playing as second player')
@@ -124,19 +311,19 @@ def multiple_games(game, num_games, bot1, bot2):
 
     return {player0.name: results[1]/num_games, player1.name: results[2]/num_games, 'draws': results[0]/num_games}
 
-def evaluate_bot(game_size, num_games, game_class, bot, bechmark_bot):
+def evaluate_bot(game_size, num_games, game_class, bot, bechmark_bot, recorder=None, win_length=None):
 
-    game = game_class(game_size)
+    game = game_class(game_size, win_length)
 
     bot_test_first = bot(game_size, game.winning_configurations, 0)
     bot_test_second = bot(game_size, game.winning_configurations, 1)
     bot_benchmark = bechmark_bot(game_size, game.winning_configurations)
 
     print(f'Ouput for the bot {bot_test_first} playing as first player and the bot {bot_benchmark} playing as second player')
-    result1 = multiple_games(game, num_games, bot_test_first, bot_benchmark)
+    result1 = multiple_games(game, num_games, bot_test_first, bot_benchmark, recorder)
 
     print(f'\nOuput for the bot {bot_test_second} playing as second player and the bot {bot_benchmark} playing as first player')
-    result2 = multiple_games(game, num_games, bot_benchmark, bot_test_second)
+    result2 = multiple_games(game, num_games, bot_benchmark, bot_test_second, recorder)
 
     full_results = {key : (result1[key]*num_games)+(result2[key]*num_games) for key in result1.keys()}
 